@@ -1,4 +1,5 @@
 from .schematic import Schematic
 from .layout import Layout
 from .simulator import Simulator
+from .results import SweepResult
 from .utils import *
\ No newline at end of file
@@ -0,0 +1,132 @@
+import itertools
+
+from skillbridge import Var
+from skillbridge.client.translator import python_value_to_skill
+
+
+# unique table name for every batch
+_batch_ids = itertools.count()
+
+
+class Deferred:
+    '''
+    Result of a SKILL call queued in a SkillBatch. value holds the returned db object once the batch is sent.\n
+     -var: Var referring to the result inside SKILL, usable as an argument of later queued calls\n
+    '''
+    def __init__(self, batch, var):
+        self.batch = batch
+        self.var = var
+        self.value = None
+        self.resolved = False
+
+    def __repr_skill__(self):
+        # inside the batch refer to the SKILL value, afterwards to the resolved object
+        if self.resolved:
+            return python_value_to_skill(self.value)
+        return self.var.__repr_skill__()
+
+    def __getitem__(self, index):
+        # eg. the first wire of the list returned by schCreateWire
+        if self.resolved:
+            return self.value[index]
+        return Var(f'nth({index} {self.var.name})')
+
+    def __repr__(self):
+        if self.resolved:
+            return f'Deferred({self.value})'
+        return f'Deferred({self.var.name})'
+
+
+class SkillBatch:
+    '''
+    Queues SKILL calls and sends them to Virtuoso in as few round trips as possible.
+    Results are stored in a SKILL table and the ones asked for are returned in one list when the batch is sent.\n
+     -ws: workspace to send the calls to\n
+     -max_length: maximum number of characters sent in one call\n
+    '''
+    def __init__(self, ws, max_length=None):
+        self.ws = ws
+        self.max_length = max_length if max_length is not None else max(ws.max_transmission_length // 2, 1000)
+        self.table = f'guruBatch{next(_batch_ids)}'
+        self.code = []
+        self.deferred = []
+        self.callbacks = []
+        self.n = 0
+
+    def call(self, fn, *args, keep=True, **kwargs):
+        """
+        Queue fn(*args, **kwargs), fn is a skillbridge function (eg. ws.sch.create_inst).
+
+        Parameters
+        ----------
+        keep : bool
+            return the result to python when the batch is sent (Deferred.value)
+
+        Returns a Deferred usable as an argument of later calls in the batch
+        """
+        var = Var(f'{self.table}[{self.n}]')
+        self.n += 1
+        self.code.append(f'{var.name} = {fn.lazy(*args, **kwargs)}')
+
+        d = Deferred(self, var)
+        if keep:
+            self.deferred.append(d)
+        return d
+
+    def on_send(self, fn):
+        """
+        Call fn() after the batch is sent and the Deferred values are resolved.
+        """
+        self.callbacks.append(fn)
+
+    def chunks(self, code):
+        chunk = []
+        length = 0
+        for c in code:
+            if len(chunk) > 0 and length + len(c) > self.max_length:
+                yield chunk
+                chunk = []
+                length = 0
+            chunk.append(c)
+            length += len(c) + 1
+        if len(chunk) > 0:
+            yield chunk
+
+    def send(self):
+        """
+        Evaluate the queued calls, resolve the Deferred values and run the on_send callbacks.
+        The queue is cleared and the SKILL table freed even if a call fails, a failed batch is not sent again.
+        """
+        if len(self.code) == 0 and len(self.callbacks) == 0:
+            return
+
+        code = [f'{self.table} = makeTable("{self.table}" nil)'] + self.code
+        deferred = self.deferred
+        callbacks = self.callbacks
+        self.code = []
+        self.deferred = []
+        self.callbacks = []
+
+        chunks = list(self.chunks(code))
+        try:
+            for i, chunk in enumerate(chunks):
+                try:
+                    self.ws['progn'](*[Var(c) for c in chunk], Var('t'))
+                except Exception as e:
+                    raise Exception(f"Batch {self.table} failed in chunk {i + 1} of {len(chunks)}, the calls of the "
+                                    f"chunks before it were applied so the cellview is partially built: {e}") from e
+
+            # return the kept results
+            refs = [d.var.name for d in deferred]
+            values = []
+            for chunk in self.chunks(refs):
+                values += self.ws['list'](*[Var(r) for r in chunk])
+        finally:
+            self.ws['progn'](Var(f'{self.table} = nil'))
+
+        for d, v in zip(deferred, values):
+            d.value = v
+            d.resolved = True
+
+        for fn in callbacks:
+            fn()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from .results import SweepResult
+
+
+class ResultCache:
+    '''
+    On disk cache of simulation results keyed on a hash of everything that affects them.\n
+     -cache_dir: directory holding one .npz file per result\n
+     -max_size: total size in bytes kept on disk, least recently used results are removed first\n
+     -max_age: results not used for this many seconds are removed\n
+    '''
+    def __init__(self, cache_dir=None, max_size=2e9, max_age=7 * 24 * 3600, verbose=True):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'guru', 'results')
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.max_age = max_age
+        self.verbose = verbose
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(files, settings):
+        """
+        Hash the contents of files and a json serializable dictionary of settings.
+        Missing files are hashed by name only.
+        """
+        h = hashlib.sha256()
+        for f in files:
+            h.update(os.path.basename(f).encode())
+            if os.path.isfile(f):
+                with open(f, 'rb') as fh:
+                    for block in iter(lambda: fh.read(1 << 20), b''):
+                        h.update(block)
+            else:
+                h.update(b'<missing>')
+
+        h.update(json.dumps(settings, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.npz')
+
+    def get(self, key):
+        """
+        Returns the SweepResult stored under key or None.
+        """
+        path = self.path(key)
+        if not os.path.isfile(path):
+            return None
+
+        if time.time() - os.path.getmtime(path) > self.max_age:
+            os.remove(path)
+            return None
+
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                names = [str(n) for n in data['names']]
+                params = [str(p) for p in data['params']]
+                result = SweepResult(data['x'],
+                                     {n: data[f'wave_{i}'] for i, n in enumerate(names)},
+                                     {p: data[f'coord_{i}'] for i, p in enumerate(params)},
+                                     data['lengths'])
+        except Exception as e:
+            if self.verbose:
+                print(f'Removing unreadable cache entry {path}: {e}')
+            os.remove(path)
+            return None
+
+        # mark as recently used
+        os.utime(path)
+        return result
+
+    def put(self, key, result):
+        """
+        Store a SweepResult under key and evict old entries.
+        """
+        arrays = {'x': result.x, 'lengths': result.lengths,
+                  'names': np.asarray(result.names, dtype=str),
+                  'params': np.asarray(result.params, dtype=str)}
+        for i, n in enumerate(result.names):
+            arrays[f'wave_{i}'] = result[n]
+        for i, p in enumerate(result.params):
+            arrays[f'coord_{i}'] = result.coords[p]
+
+        tmp_path = self.path(key) + f'.{os.getpid()}.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, self.path(key))
+
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for f in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, f)
+            if f.endswith('.npz') and '.tmp.' not in f and os.path.isfile(path):
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Remove entries older than max_age, then the least recently used until the cache fits in max_size.
+        """
+        now = time.time()
+        entries = []
+        for mtime, size, path in self.entries():
+            if now - mtime > self.max_age:
+                os.remove(path)
+            else:
+                entries.append((mtime, size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
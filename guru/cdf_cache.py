@@ -0,0 +1,99 @@
+from skillbridge import Var
+from skillbridge.client.translator import python_value_to_skill
+
+from .batch import SkillBatch
+
+
+def skill(value):
+    """
+    SKILL code of a python value or skillbridge object.
+    """
+    return python_value_to_skill(value)
+
+
+def evaluate(ws, code):
+    """
+    Evaluate SKILL code in one call and return the result.
+    """
+    return ws['progn'](Var(code))
+
+
+def read_values(ws, cv, requests):
+    """
+    Read CDF parameter values of many instances in as few calls as the transmission length allows.
+
+    Parameters
+    ----------
+    requests : list of (string, list of strings)
+        instance name and the cdf names of the parameters to read (eg. [('MN1', ['w', 'l']), ...])
+
+    Returns a list with the list of values of every request
+    """
+    reads = [f'let((cdf) cdf = cdfGetInstCDF(dbFindAnyInstByName({skill(cv)} {skill(name)})) '
+             f'list({" ".join(f"cdfFindParamByName(cdf {skill(p)})->value" for p in params)}))'
+             for name, params in requests]
+
+    values = []
+    for chunk in SkillBatch(ws).chunks(reads):
+        values += evaluate(ws, f'list({" ".join(chunk)})')
+    return values
+
+
+class CDFCache:
+    '''
+    Caches the CDF parameter names and default values per (lib, cell) so instances of a known
+    cell do not read the CDF from Virtuoso again.\n
+     -params: {(lib, cell) : list of (name, cdf name, default value)}\n
+    '''
+    def __init__(self):
+        self.params = {}
+
+    def parameters(self, ws, inst, lib_name, cell_name):
+        """
+        List of (name, cdf name, default value) of the CDF parameters of an instance, None if it has no CDF.
+        name is the cdf name without '?'.
+        """
+        key = (lib_name, cell_name)
+        if key in self.params:
+            return self.params[key]
+
+        info = evaluate(ws, f'let((cdf) cdf = cdfGetInstCDF({skill(inst)}) '
+                            f'when(cdf mapcar(lambda((p) list(p->name p->defValue)) cdf->parameters)))')
+        if info is None:
+            return None
+
+        params = [(name.replace('?', ''), name, default) for name, default in info]
+        self.params[key] = params
+        return params
+
+    def cdf_name(self, lib_name, cell_name, name):
+        """
+        CDF name of a parameter of a cell read before, name itself otherwise.
+        """
+        for p_name, cdf_name, _ in self.params.get((lib_name, cell_name)) or []:
+            if p_name == name:
+                return cdf_name
+        return name
+
+    def cdf_names(self, ws, cv, inst_name, lib_name, cell_name, names):
+        """
+        CDF names of parameters of an instance in cv, the CDF of the cell is read once if it was not read before.
+        """
+        if (lib_name, cell_name) not in self.params:
+            self.parameters(ws, Var(f'dbFindAnyInstByName({skill(cv)} {skill(inst_name)})'), lib_name, cell_name)
+        return [self.cdf_name(lib_name, cell_name, n) for n in names]
+
+    def invalidate(self, lib_name=None, cell_name=None):
+        self.params = {k: v for k, v in self.params.items()
+                       if not ((lib_name is None or k[0] == lib_name) and (cell_name is None or k[1] == cell_name))}
+
+
+# shared by every Schematic in this process
+_cache = None
+
+
+def default_cdf_cache():
+    global _cache
+    if _cache is None:
+        _cache = CDFCache()
+    return _cache
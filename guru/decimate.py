@@ -0,0 +1,154 @@
+# Display resolution decimation of waves for plotting.
+# Both methods work on (rows, samples) arrays so every wave of an axis is reduced in one call.
+import numpy as np
+
+
+def _bins(x, n_bins):
+    # split the samples of every row into n_bins equal sized bins, returns (rows, n_bins, bin size) views
+    n = x.shape[1]
+    size = int(np.ceil(n / n_bins))
+    pad = size * n_bins - n
+    if pad > 0:
+        x = np.concatenate([x, np.full((x.shape[0], pad), np.nan)], axis=1)
+    return x.reshape(x.shape[0], n_bins, size)
+
+
+def minmax(x, y, n_out):
+    """
+    Keep the first, minimum, maximum and last sample of each bin so peaks and edges stay visible.
+
+    Parameters
+    ----------
+    x : np array
+        (rows, samples) x values, nan padded rows are allowed
+    y : np array
+        (rows, samples) y values
+    n_out : int
+        approximate number of samples to keep in each row
+
+    Returns decimated (rows, n) x and y arrays, samples stay in x order within each row
+    """
+    x = np.atleast_2d(x)
+    y = np.atleast_2d(y)
+    n_bins = max(n_out // 4, 1)
+    if x.shape[1] <= n_out or x.shape[1] <= 4 * n_bins:
+        return x, y
+
+    xb = _bins(x, n_bins)
+    yb = _bins(y, n_bins)
+
+    # nan samples (padding) never win the min / max
+    valid = ~np.isnan(yb)
+    has_valid = valid.any(axis=2)
+    i_min = np.argmin(np.where(valid, yb, np.inf), axis=2)
+    i_max = np.argmax(np.where(valid, yb, -np.inf), axis=2)
+    i_first = np.argmax(valid, axis=2)
+    i_last = yb.shape[2] - 1 - np.argmax(valid[:, :, ::-1], axis=2)
+
+    idx = np.sort(np.stack([i_first, i_min, i_max, i_last], axis=2), axis=2)
+    x_out = np.take_along_axis(xb, idx, axis=2)
+    y_out = np.take_along_axis(yb, idx, axis=2)
+
+    # empty bins (all padding) stay nan which matplotlib skips
+    x_out[~has_valid] = np.nan
+    y_out[~has_valid] = np.nan
+    return x_out.reshape(x.shape[0], -1), y_out.reshape(y.shape[0], -1)
+
+
+def lttb(x, y, n_out):
+    """
+    Largest triangle three buckets downsampling (Steinarsson 2013), keeps the samples
+    which form the largest triangles with their neighbouring buckets.
+
+    Parameters
+    ----------
+    x : np array
+        (rows, samples) x values without nan padding
+    y : np array
+        (rows, samples) y values
+    n_out : int
+        number of samples to keep in each row
+
+    Returns decimated (rows, n_out) x and y arrays
+    """
+    x = np.atleast_2d(x)
+    y = np.atleast_2d(y)
+    n = x.shape[1]
+    if n <= n_out or n_out < 3:
+        return x, y
+
+    rows = np.arange(x.shape[0])
+    # bucket edges for the samples between the first and last
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+
+    x_out = np.empty((x.shape[0], n_out))
+    y_out = np.empty((y.shape[0], n_out))
+    x_out[:, 0], y_out[:, 0] = x[:, 0], y[:, 0]
+    x_out[:, -1], y_out[:, -1] = x[:, -1], y[:, -1]
+
+    # every row advances bucket by bucket together
+    prev = np.zeros(x.shape[0], dtype=int)
+    for b in range(n_out - 2):
+        start, stop = edges[b], edges[b + 1]
+        if b < n_out - 3:
+            next_stop = edges[b + 2]
+            x_avg = x[:, stop:next_stop].mean(axis=1)
+            y_avg = y[:, stop:next_stop].mean(axis=1)
+        else:
+            x_avg, y_avg = x[:, -1], y[:, -1]
+
+        xa, ya = x[rows, prev], y[rows, prev]
+        xs, ys = x[:, start:stop], y[:, start:stop]
+        area = np.abs((xa - x_avg)[:, None] * (ys - ya[:, None]) - (xa[:, None] - xs) * (y_avg - ya)[:, None])
+        prev = start + np.argmax(area, axis=1)
+        x_out[:, b + 1], y_out[:, b + 1] = x[rows, prev], y[rows, prev]
+
+    return x_out, y_out
+
+
+def window(x, y, xlim, margin=1):
+    """
+    Cut the samples of every row down to the columns within xlim (plus margin samples either side).
+    """
+    x = np.atleast_2d(x)
+    y = np.atleast_2d(y)
+    inside = (x >= xlim[0]) & (x <= xlim[1])
+    cols = np.flatnonzero(inside.any(axis=0))
+    if len(cols) == 0:
+        return x[:, :0], y[:, :0]
+    lo = max(cols[0] - margin, 0)
+    hi = min(cols[-1] + margin + 1, x.shape[1])
+    return x[:, lo:hi], y[:, lo:hi]
+
+
+def decimate(x, y, n_out, method='minmax', xlim=None):
+    """
+    Decimate (rows, samples) arrays to about n_out samples per row for display.
+
+    Parameters
+    ----------
+    method : string
+        'minmax' - first, min, max and last of each bin, best for fast edges and glitches
+        'lttb' - largest triangle three buckets, closer to the shape of smooth waves
+    xlim : tuple
+        only decimate the visible range (eg. the axis limits after a zoom)
+    """
+    if xlim is not None:
+        x, y = window(x, y, xlim)
+
+    if method == 'minmax':
+        return minmax(x, y, n_out)
+    elif method == 'lttb':
+        if np.isnan(x).any():
+            # lttb needs equal length rows, decimate the nan padded rows one by one
+            rows = [lttb(x_i[~np.isnan(x_i)], y_i[~np.isnan(x_i)], n_out) for x_i, y_i in zip(x, y)]
+            n = max(r[0].shape[1] for r in rows)
+            x_out = np.full((len(rows), n), np.nan)
+            y_out = np.full((len(rows), n), np.nan)
+            for i, (x_i, y_i) in enumerate(rows):
+                x_out[i, :x_i.shape[1]] = x_i[0]
+                y_out[i, :y_i.shape[1]] = y_i[0]
+            return x_out, y_out
+        return lttb(x, y, n_out)
+    else:
+        raise Exception(f"Invalid decimation method: {method}. Use one of: ['minmax', 'lttb']")
@@ -1,99 +1,248 @@
 import numpy as np
-from skillbridge import Workspace
+from skillbridge import Var, Workspace
 
-from .utils import i_transform, rotate, internal_iter, calc_center, transform, snap_spacing
+from .utils import internal_iter, rotation_matrix, transform, snap_spacing
+from .symbol_cache import default_symbol_cache
+from .cdf_cache import default_cdf_cache, evaluate, skill
+
+
+# lazy proxy of one CDF parameter of an instance, the database is only read or written on access
+class _Param:
+    __slots__ = ('params', 'name', 'cdf_name', 'default')
+
+    def __init__(self, params, name, cdf_name, default):
+        self.params = params
+        self.name = name
+        self.cdf_name = cdf_name
+        self.default = default
+
+    def code(self):
+        return f'cdfFindParamByName(cdfGetInstCDF({skill(self.params.inst.inst)}) {skill(self.cdf_name)})'
+
+    @property
+    def value(self):
+        return evaluate(self.params.ws, f'{self.code()}->value')
+
+    @value.setter
+    def value(self, value):
+        evaluate(self.params.ws, f'{self.code()}->value = {skill(value)}')
+
+    # any other CDF parameter attribute (eg. prompt, paramType) is read from the database
+    def __getattr__(self, key):
+        return getattr(evaluate(self.params.ws, self.code()), key)
+
+    def __repr__(self):
+        return f"_Param({self.name})"
 
 
 # holds parameter information and allows setting of parameters
+# parameter names and defaults are cached per (lib, cell), values are read and written on access
 class _Params:
     def __init__(self, inst):
         self.ws = inst.ws
+        self.inst = inst
         self.names = []
-        inst_cdf = inst.ws.cdf.get_inst_CDF(inst.inst)
-        if inst_cdf is not None:
-            params = inst_cdf.parameters
-            if params is not None:
-                for x in params:
-                    param_name = x.name.replace("?", "")
-                    self.names.append(param_name)
-                    setattr(self, param_name, x)
+        self.params = {}
+
+        cdf_params = default_cdf_cache().parameters(inst.ws, inst.inst, inst.lib_name, inst.cell_name)
+        if cdf_params is not None:
+            for name, cdf_name, default in cdf_params:
+                self.names.append(name)
+                self.params[name] = _Param(self, name, cdf_name, default)
         else:
             print(f"Instance.py Warning: unable to get inst CDF for '{inst.name}'")
 
     def __setitem__(self, key, value):
-        getattr(self, key).value = value
+        self[key].value = value
 
     def __getitem__(self, key):
-        return getattr(self, key)
+        try:
+            return self.params[key]
+        except KeyError:
+            raise Exception(f"Error: parameter '{key}' does not exist on '{self.inst.name}'. Available parameters: {self.names}")
+
+    def __getattr__(self, key):
+        params = self.__dict__.get('params', {})
+        if key in params:
+            return params[key]
+        raise AttributeError(key)
 
     def __iter__(self):
-        return internal_iter(self, self.names)
+        return iter([self.params[n] for n in self.names])
+
+    def get_many(self, names=None):
+        """
+        Read several parameter values in one call. Returns a dictionary keyed on parameter name.
+
+        Parameters
+        ----------
+        names : list of strings
+            parameters to read (eg. ['w', 'l']), defaults to all
+        """
+        if names is None:
+            names = self.names
+        if len(names) == 0:
+            return {}
+
+        finds = ' '.join(f'cdfFindParamByName(cdf {skill(self[n].cdf_name)})->value' for n in names)
+        values = evaluate(self.ws, f'let((cdf) cdf = cdfGetInstCDF({skill(self.inst.inst)}) list({finds}))')
+        return dict(zip(names, values))
+
+    def set_many(self, values):
+        """
+        Write several parameter values in one call (eg. set_many({'w' : '1u', 'l' : '180n'})).
+        """
+        if len(values) == 0:
+            return
+
+        sets = ' '.join(f'cdfFindParamByName(cdf {skill(self[n].cdf_name)})->value = {skill(v)}' for n, v in values.items())
+        evaluate(self.ws, f'let((cdf) cdf = cdfGetInstCDF({skill(self.inst.inst)}) {sets} t)')
+
+
+# view of one pin in the position array of its instance's _Pins
+class _Pin:
+    __slots__ = ('pins', 'index')
 
+    def __init__(self, pins, index):
+        self.pins = pins
+        self.index = index
 
-class _Pin:
-    def __init__(self, fname, name, pos , x, y, netname):
-        self.fname = fname
-        self.name = name
-        self.pos = pos
-        self.x = x
-        self.y = y
-        self.netname = netname
+    @property
+    def name(self):
+        return self.pins.names[self.index]
 
-# Pin = namedtuple('Pin', 'x y')
+    @property
+    def fname(self):
+        return f"/{self.pins.inst_name}/{self.name}"
 
+    # a copy, so callers doing pin.pos += offset do not move the pin (or an instance array's pins)
+    @property
+    def pos(self):
+        return self.pins.positions[self.index].copy()
 
-# Holds pin information for an instance
-class _Pins:
-    def __init__(self, inst):
+    @property
+    def x(self):
+        return self.pins.positions[self.index, 0]
 
-        pl = inst.ws.sch.symbol_to_pin_list(inst.inst.lib_name,
-                                            inst.inst.cell_name, "symbol")
+    @property
+    def y(self):
+        return self.pins.positions[self.index, 1]
 
-        self.names = [x["name"] for x in pl["ports"]]
+    @property
+    def netname(self):
+        return self.pins.netnames[self.index]
 
-        for x in pl["ports"]:
-            bbox = x["pins"][0]["fig"]["bBox"]
-            # get pos from virtuoso coords
-            pos = calc_center(bbox)
-            pos = np.asarray(pos)
+    @netname.setter
+    def netname(self, value):
+        self.pins.netnames[self.index] = value
 
-            if inst.mirrored == 'Y':
-                pos[0] = -pos[0]
-            elif inst.mirrored == 'X':
-                pos[1] = -pos[1]
+    def __repr__(self):
+        return f"_Pin({self.fname}, {list(self.pos)})"
 
-            pos = [pos[0] + inst.vpos[0], pos[1] + inst.vpos[1]]
+# Pin = namedtuple('Pin', 'x y')
 
-            pos = rotate(pos, inst.vpos, inst.rot)
 
-            # transform out of virtuoso coords
-            pos = i_transform(pos)
-            full_name = f"/{inst.name}/{x['name']}"
-            p = _Pin(full_name, x["name"], pos, pos[0], pos[1], None)
-            # p = Pin(pos[0], pos[1])
-            setattr(self, x["name"], p)
+# Holds pin information for an instance
+# positions - (n_pins, 2) array of pin positions in schematic coords, pins are views into it
+#             computed from the symbol unless given (eg. by an instance array)
+class _Pins:
+    def __init__(self, inst, positions=None):
+        names, centers = default_symbol_cache().pin_centers(inst.ws, inst.lib_name, inst.cell_name)
+
+        self.inst_name = inst.name
+        self.names = names
+        self.index = {n: i for i, n in enumerate(names)}
+        self.netnames = [None] * len(names)
+        if positions is None:
+            positions = self.transform(centers, inst.vpos, inst.mirrored, inst.rot)
+        self.positions = positions
+
+    # moves symbol pin centers (virtuoso coords) to the instance position and orientation, in schematic coords
+    @staticmethod
+    def transform(centers, vpos, mirrored, rot):
+        pos = np.array(centers, dtype=float)
+
+        if mirrored == 'Y':
+            pos[:, 0] = -pos[:, 0]
+        elif mirrored == 'X':
+            pos[:, 1] = -pos[:, 1]
+
+        vpos = np.asarray(vpos, dtype=float)
+        pos = (pos @ rotation_matrix(rot).T) + vpos
+
+        # transform out of virtuoso coords
+        return pos / snap_spacing
+
+    def xy(self, names):
+        """
+        (len(names), 2) array of the positions of several pins.
+        """
+        return self.positions[[self.index[n] for n in names]]
 
     def __getitem__(self, key):
         try:
-            return getattr(self, key)
+            return _Pin(self, self.index[key])
         except:
             raise(Exception(f"Error: pin '{key}' does not exist. Available pins: {self.names}"))
 
+    def __getattr__(self, key):
+        index = self.__dict__.get('index', {})
+        if key in index:
+            return _Pin(self, index[key])
+        raise AttributeError(key)
+
     def __iter__(self):
         return internal_iter(self, self.names)
 
+    def __len__(self):
+        return len(self.names)
+
+
+# position of an instance in virtuoso coords, transistor symbols are offset so their pins land on the grid
+def inst_vpos(cell_name, pos):
+    pos = np.asarray(pos)
+    if 'fet' in cell_name or 'mos' in cell_name:
+        return transform(pos + [-0.25/snap_spacing, 0.])
+    return transform(pos)
+
 
 # Allows creation and manipulation of a symbol in a schematic
+# batch - SkillBatch to queue the creation in, the db objects and parameters are available once it is sent
+# pin_positions - precomputed (n_pins, 2) pin positions, eg. from an instance array
 class _Inst:
-    def __init__(self, ws : Workspace, cv, lib_name, cell_name, pos, name, rot):
+    def __init__(self, ws : Workspace, cv, lib_name, cell_name, pos, name, rot, batch=None, pin_positions=None):
         self.ws = ws
         self.cv = cv
-        
-        self.pos = np.asarray(pos)
-        if 'fet' in cell_name or 'mos' in cell_name:
-            self.vpos = transform(self.pos + [-0.25/snap_spacing, 0.])
+        self.place(cell_name, pos, rot)
+
+        self.lib_name = lib_name
+        self.cell_name = cell_name
+        self.name = name
+
+        self.applied_params = {}
+        self.params = None
+        self.batch = batch
+
+        # the symbol is opened once per session
+        inst_cv = default_symbol_cache().cellview(ws, lib_name, cell_name)
+        self.inst_cv = inst_cv
+
+        if batch is None:
+            inst = ws.sch.create_inst(self.cv, inst_cv, name, list(self.vpos), rot)
+            
+            self.inst = inst
+
+            self.params = _Params(self)
         else:
-            self.vpos = transform(self.pos)
+            self.inst = batch.call(ws.sch.create_inst, self.cv, inst_cv, name, list(self.vpos), rot)
+            batch.on_send(self.resolve)
+
+        # pin positions only need the symbol, they are available inside a batch
+        self.pins = _Pins(self, pin_positions)
+
+    def place(self, cell_name, pos, rot):
+        self.pos = np.asarray(pos)
+        self.vpos = inst_vpos(cell_name, self.pos)
 
         if rot[0] != 'M':
             self.mirrored = False
@@ -105,26 +254,39 @@ class _Inst:
             else:
                 self.rot = 0
 
-        self.lib_name = lib_name
-        self.cell_name = cell_name
-        self.name = name
-
-        inst_cv = ws.db.open_cell_view_by_type(lib_name, cell_name, "symbol")
-        
-        inst = ws.sch.create_inst(self.cv, inst_cv, name, list(self.vpos), rot)
-        
-        self.inst_cv = inst_cv
-        self.inst = inst
-
-        self.applied_params = {}
+    # called when the batch creating this instance is sent
+    def resolve(self):
+        self.inst = self.inst.value
+        self.batch = None
         self.params = _Params(self)
-        self.pins = _Pins(self)
+
+        # parameters set inside the batch were written with it, unknown names were skipped there
+        # (a warning, raising here would leave the other instances of the batch unresolved)
+        unknown = [k for k in self.applied_params if k not in self.params.params]
+        if len(unknown) > 0:
+            print(f"Instance.py Warning: parameters {unknown} do not exist on '{self.name}' and were not set. Available parameters: {self.params.names}")
+
+    # queues the parameter write in the batch, next to the call creating the instance
+    def queue_param(self, key, value):
+        cache = default_cdf_cache()
+        if (self.lib_name, self.cell_name) in cache.params:
+            find = f'cdfFindParamByName(cdf {skill(cache.cdf_name(self.lib_name, self.cell_name, key))})'
+        else:
+            # the CDF of the cell was not read yet, match the name without '?' in SKILL
+            find = f'car(setof(x cdf->parameters buildString(parseString(x->name "?") "") == {skill(key)}))'
+        code = f'let((cdf p) cdf = cdfGetInstCDF({skill(self.inst)}) when(p = {find} p->value = {skill(value)}) t)'
+        self.batch.call(self.ws['progn'], Var(code), keep=False)
 
     def __setitem__(self, key, value):
         self.applied_params[key] = value
-        self.params[key] = value
+        if self.params is not None:
+            self.params[key] = value
+        else:
+            self.queue_param(key, value)
 
     def __getitem__(self, key):
+        if self.params is None:
+            raise Exception(f"Parameters of '{self.name}' are not available until its batch is sent")
         return self.params[key].value
 
     def __repr__(self):
@@ -147,9 +309,10 @@ class _Inst:
         repr += "\n"
 
         repr += "Parameter Names: \n\t"
-        for p in self.params:
-            repr += p.name
-            repr += ", "
+        if self.params is not None:
+            for p in self.params:
+                repr += p.name
+                repr += ", "
         repr += "\n"
 
         repr += "Applied Parameters: \n"
@@ -160,3 +323,105 @@ class _Inst:
             repr += str(self.applied_params[p])
             repr += "\n"
         return repr
+
+
+# _Inst of an instance that already exists in the cellview (eg. created by a compiled schematic)
+# nothing is sent to Virtuoso until the db object, parameters or pins are used
+# deferred - parameters are only recorded, the schematic writes the ones that changed (see SchematicSync)
+class _LazyInst(_Inst):
+    def __init__(self, ws : Workspace, cv, lib_name, cell_name, pos, name, rot, applied_params=None, deferred=False):
+        self.ws = ws
+        self.cv = cv
+        self.place(cell_name, pos, rot)
+
+        self.lib_name = lib_name
+        self.cell_name = cell_name
+        self.name = name
+
+        self.applied_params = dict(applied_params or {})
+        self.deferred = deferred
+        self._inst = None
+        self._params = None
+        self._pins = None
+
+    @property
+    def inst(self):
+        if self._inst is None:
+            self._inst = evaluate(self.ws, f'dbFindAnyInstByName({skill(self.cv)} {skill(self.name)})')
+        return self._inst
+
+    @property
+    def inst_cv(self):
+        return default_symbol_cache().cellview(self.ws, self.lib_name, self.cell_name)
+
+    @property
+    def params(self):
+        if self._params is None:
+            self._params = _Params(self)
+        return self._params
+
+    @property
+    def pins(self):
+        if self._pins is None:
+            self._pins = _Pins(self)
+        return self._pins
+
+    def __setitem__(self, key, value):
+        self.applied_params[key] = value
+        if not self.deferred:
+            self.params[key] = value
+
+
+# Grid of instances of one cell created by Schematic.create_instance_array, indexed [r, c]
+# pos - (rows, cols, 2) array of instance positions
+# pin_positions - (rows, cols, n_pins, 2) array of the pin positions of every instance
+class _InstArray:
+    def __init__(self, instances, pos, pin_names, pin_positions):
+        self.instances = instances
+        self.shape = instances.shape
+        self.pos = pos
+        self.pin_names = pin_names
+        self.pin_index = {n: i for i, n in enumerate(pin_names)}
+        self.pin_positions = pin_positions
+
+    @property
+    def names(self):
+        return np.vectorize(lambda i: i.name, otypes=[object])(self.instances)
+
+    def pin_xy(self, name):
+        """
+        (rows, cols, 2) array of the positions of one pin on every instance (eg. arr.pin_xy('BL')[:, 0]).
+        """
+        if name not in self.pin_index:
+            raise Exception(f"Error: pin '{name}' does not exist. Available pins: {self.pin_names}")
+        return self.pin_positions[..., self.pin_index[name], :]
+
+    def pins(self, name):
+        """
+        (rows, cols) array of one pin of every instance, usable in create_wire and ConnPos.
+        """
+        if name not in self.pin_index:
+            raise Exception(f"Error: pin '{name}' does not exist. Available pins: {self.pin_names}")
+        return np.vectorize(lambda i: i.pins[name], otypes=[object])(self.instances)
+
+    # arr[r, c] is an instance, arr[r] or arr[:, c] an array of instances
+    def __getitem__(self, key):
+        return self.instances[key]
+
+    # arr['w'] = '1u' sets a parameter on every instance, arr['w'] = values sets one value per instance
+    def __setitem__(self, key, value):
+        if np.ndim(value) == 0:
+            value = np.full(self.shape, value, dtype=object)
+        value = np.broadcast_to(np.asarray(value, dtype=object), self.shape)
+        for index, inst in np.ndenumerate(self.instances):
+            inst[key] = value[index]
+
+    def __iter__(self):
+        return iter(self.instances.flat)
+
+    def __len__(self):
+        return self.instances.size
+
+    def __repr__(self):
+        inst = self.instances.flat[0]
+        return f"_InstArray({inst.lib_name}/{inst.cell_name}, {self.shape[0]}x{self.shape[1]})"
@@ -0,0 +1,292 @@
+# Waveform measurements computed on every sweep point at once.
+# Each function takes a Simulator (after run) or a SweepResult and wave names,
+# and returns one value per sweep point. Rows padded with nan (see SweepResult) are handled.
+import numpy as np
+
+from .results import SweepResult
+
+
+# scale factors of the x units accepted by the measurements (Simulator.x is in seconds)
+units_scale = {'s': 1., 'ms': 1e-3, 'us': 1e-6, 'ns': 1e-9, 'ps': 1e-12, 'fs': 1e-15}
+
+
+def _scale(units):
+    try:
+        return units_scale[units]
+    except KeyError:
+        raise Exception(f"Invalid units: {units}. Use one of: {list(units_scale.keys())}")
+
+
+def _result(res):
+    if isinstance(res, SweepResult):
+        return res
+    if getattr(res, 'result', None) is None:
+        raise Exception('No results to measure, run the simulation first')
+    return res.result
+
+
+def _wave(result, wave):
+    if isinstance(wave, str):
+        return result[wave]
+    y = np.atleast_2d(np.asarray(wave, dtype=float))
+    if y.shape != result.x.shape:
+        raise Exception(f'Wave has shape {y.shape}, expected {result.x.shape}')
+    return y
+
+
+def _window(x, start, stop, units):
+    # boolean mask of the samples in [start, stop] (given in units), nan padding excluded
+    s = _scale(units)
+    m = ~np.isnan(x)
+    if start is not None:
+        m &= x >= start * s
+    if stop is not None:
+        m &= x <= stop * s
+    return m
+
+
+def _per_row(v, n_rows):
+    return np.broadcast_to(np.asarray(v, dtype=float), (n_rows,))
+
+
+def _crossings(x, y, threshold, edge='rise', n=1, after=None):
+    # x of the n-th crossing of threshold in every row, interpolated between samples, nan if there is none
+    threshold = _per_row(threshold, x.shape[0])[:, None]
+    y0, y1 = y[:, :-1], y[:, 1:]
+
+    valid = ~(np.isnan(y0) | np.isnan(y1) | np.isnan(x[:, :-1]) | np.isnan(x[:, 1:]))
+    if after is not None:
+        valid &= x[:, :-1] >= _per_row(after, x.shape[0])[:, None]
+
+    rising = (y0 < threshold) & (y1 >= threshold)
+    falling = (y0 > threshold) & (y1 <= threshold)
+    if edge == 'rise':
+        c = rising & valid
+    elif edge == 'fall':
+        c = falling & valid
+    elif edge == 'either':
+        c = (rising | falling) & valid
+    else:
+        raise Exception(f"Invalid edge: {edge}. Use one of: ['rise', 'fall', 'either']")
+
+    count = np.cumsum(c, axis=1)
+    found = count[:, -1] >= n
+    idx = np.argmax(count >= n, axis=1)
+
+    rows = np.arange(x.shape[0])
+    xa, xb = x[rows, idx], x[rows, idx + 1]
+    ya, yb = y[rows, idx], y[rows, idx + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(yb != ya, (threshold[:, 0] - ya) / (yb - ya), 0.)
+    return np.where(found, xa + t * (xb - xa), np.nan)
+
+
+def crossings(res, wave, threshold, edge='rise', n=1, start=None, units='s'):
+    """
+    Time of the n-th crossing of threshold by wave in every sweep point.
+
+    Parameters
+    ----------
+    res : Simulator or SweepResult
+        results to measure
+    wave : string or np array
+        wave name (eg. '/out') or a (sweep point, time) array
+    threshold : float or np array
+        level to cross, one per sweep point if an array
+    edge : string
+        'rise', 'fall' or 'either'
+    n : int
+        crossing number, 1 is the first crossing
+    start : float
+        ignore crossings before this time
+    units : string
+        units of start and of the returned times ('s', 'ms', 'us', 'ns', 'ps', 'fs')
+
+    Returns an array of times, nan where wave does not cross threshold n times
+    """
+    result = _result(res)
+    s = _scale(units)
+    after = None if start is None else start * s
+    return _crossings(result.x, _wave(result, wave), threshold, edge, n, after) / s
+
+
+def delay(res, trigger, target, threshold, target_threshold=None, edge='rise', target_edge='rise', n=1, target_n=1, units='s'):
+    """
+    Time from the n-th crossing of trigger to the following target_n-th crossing of target in every sweep point
+    (eg. delay(s, '/in', '/out', 0.6, edge='rise', target_edge='fall', units='ns')).
+    target_threshold defaults to threshold.
+    """
+    result = _result(res)
+    if target_threshold is None:
+        target_threshold = threshold
+
+    t_trig = _crossings(result.x, _wave(result, trigger), threshold, edge, n)
+    t_targ = _crossings(result.x, _wave(result, target), target_threshold, target_edge, target_n, np.nan_to_num(t_trig, nan=np.inf))
+    return (t_targ - t_trig) / _scale(units)
+
+
+def _levels(y, m, low, high):
+    # initial and final levels default to the min and max of each row in the window
+    y = np.where(m, y, np.nan)
+    if low is None:
+        low = np.nanmin(y, axis=1)
+    if high is None:
+        high = np.nanmax(y, axis=1)
+    return _per_row(low, y.shape[0]), _per_row(high, y.shape[0])
+
+
+def _transition(res, wave, edge, low, high, fractions, n, start, stop, units):
+    result = _result(res)
+    s = _scale(units)
+    x = result.x
+    m = _window(x, start, stop, units)
+    y = np.where(m, _wave(result, wave), np.nan)
+
+    low, high = _levels(y, m, low, high)
+    lo = low + fractions[0] * (high - low)
+    hi = low + fractions[1] * (high - low)
+
+    if edge == 'rise':
+        t0 = _crossings(x, y, lo, 'rise', n)
+        t1 = _crossings(x, y, hi, 'rise', 1, np.nan_to_num(t0, nan=np.inf))
+    else:
+        t0 = _crossings(x, y, hi, 'fall', n)
+        t1 = _crossings(x, y, lo, 'fall', 1, np.nan_to_num(t0, nan=np.inf))
+    return (t1 - t0) / s
+
+
+def rise_time(res, wave, low=None, high=None, fractions=(0.1, 0.9), n=1, start=None, stop=None, units='s'):
+    """
+    Rise time of the n-th rising edge of wave between fractions of the swing from low to high in every sweep point.
+    low and high default to the min and max of each sweep point within [start, stop].
+    """
+    return _transition(res, wave, 'rise', low, high, fractions, n, start, stop, units)
+
+
+def fall_time(res, wave, low=None, high=None, fractions=(0.1, 0.9), n=1, start=None, stop=None, units='s'):
+    """
+    Fall time of the n-th falling edge of wave between fractions of the swing from high to low in every sweep point.
+    low and high default to the min and max of each sweep point within [start, stop].
+    """
+    return _transition(res, wave, 'fall', low, high, fractions, n, start, stop, units)
+
+
+def _first_last(y, m):
+    # first and last value of every row within the mask
+    rows = np.arange(y.shape[0])
+    first = np.argmax(m, axis=1)
+    last = m.shape[1] - 1 - np.argmax(m[:, ::-1], axis=1)
+    return y[rows, first], y[rows, last]
+
+
+def settling_time(res, wave, tol=0.02, final=None, start=None, stop=None, units='s'):
+    """
+    Time from start until wave stays within tol of its final value in every sweep point.
+
+    Parameters
+    ----------
+    tol : float
+        allowed error as a fraction of the step from the initial to the final value
+    final : float or np array
+        final value, defaults to the last value of each sweep point within [start, stop]
+    start, stop : float
+        window to measure in (in units), defaults to the whole simulation
+    """
+    result = _result(res)
+    s = _scale(units)
+    x = result.x
+    m = _window(x, start, stop, units)
+    y = _wave(result, wave)
+
+    initial, last = _first_last(y, m)
+    final = last if final is None else _per_row(final, len(x))
+    band = np.abs(tol * (final - initial))
+
+    outside = m & (np.abs(y - final[:, None]) > band[:, None])
+    rows = np.arange(x.shape[0])
+    t0, _ = _first_last(x, m)
+
+    # the sample after the last one outside the band, or the window start if it never leaves the band
+    last_out = outside.shape[1] - 1 - np.argmax(outside[:, ::-1], axis=1)
+    settled = np.minimum(last_out + 1, outside.shape[1] - 1)
+    t = np.where(outside.any(axis=1), x[rows, settled], t0)
+    # never settles if the last sample in the window is outside the band
+    _, last_in_window = _first_last(outside, m)
+    return np.where(last_in_window, np.nan, t - t0) / s
+
+
+def overshoot(res, wave, initial=None, final=None, start=None, stop=None, units='s'):
+    """
+    Overshoot in percent of the step from initial to final in every sweep point.
+    Falling steps measure the undershoot below final. initial and final default to the first and last
+    value of each sweep point within [start, stop].
+    """
+    result = _result(res)
+    x = result.x
+    m = _window(x, start, stop, units)
+    y = np.where(m, _wave(result, wave), np.nan)
+
+    first, last = _first_last(y, m)
+    initial = first if initial is None else _per_row(initial, len(x))
+    final = last if final is None else _per_row(final, len(x))
+
+    step = final - initial
+    peak = np.where(step >= 0, np.nanmax(y, axis=1), np.nanmin(y, axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.maximum((peak - final) / step, 0.) * 100
+
+
+def _power(result, wave, current):
+    p = _wave(result, wave)
+    if current is not None:
+        p = p * _wave(result, current)
+    return p
+
+
+def _integrate(x, y, m):
+    # trapezoidal integral and duration of every row between consecutive samples inside the mask
+    seg = m[:, :-1] & m[:, 1:]
+    dx = np.where(seg, x[:, 1:] - x[:, :-1], 0.)
+    area = np.sum(np.where(seg, (y[:, 1:] + y[:, :-1]) / 2 * dx, 0.), axis=1)
+    return area, np.sum(dx, axis=1)
+
+
+def average(res, wave, start=None, stop=None, units='s'):
+    """
+    Time average (integral / duration) of wave within [start, stop] in every sweep point.
+    """
+    result = _result(res)
+    x = result.x
+    m = _window(x, start, stop, units)
+    area, duration = _integrate(x, _wave(result, wave), m)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return area / duration
+
+
+def average_power(res, wave, current=None, start=None, stop=None, units='s'):
+    """
+    Average power in every sweep point.
+    wave is a power wave (eg. saved with saveOption pwr all), or a voltage when current is given.
+    """
+    result = _result(res)
+    return average(result, _power(result, wave, current), start, stop, units)
+
+
+def peak_power(res, wave, current=None, start=None, stop=None, units='s'):
+    """
+    Largest absolute power in every sweep point.
+    wave is a power wave (eg. saved with saveOption pwr all), or a voltage when current is given.
+    """
+    result = _result(res)
+    m = _window(result.x, start, stop, units)
+    p = np.where(m, np.abs(_power(result, wave, current)), np.nan)
+    return np.nanmax(p, axis=1)
+
+
+def energy(res, wave, current=None, start=None, stop=None, units='s'):
+    """
+    Energy (integral of power over time) within [start, stop] in every sweep point.
+    """
+    result = _result(res)
+    m = _window(result.x, start, stop, units)
+    return _integrate(result.x, _power(result, wave, current), m)[0]
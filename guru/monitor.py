@@ -0,0 +1,243 @@
+import asyncio
+import os
+import signal
+
+from . import psf
+from .spectre_log import parse_progress, parse_pid
+
+
+class MonitorEvent:
+    '''
+    Event produced by SimulationMonitor.\n
+     -kind: 'progress' while running, 'waves' for partial results, 'done' once the simulation finished\n
+     -time: latest simulated time\n
+     -duration: requested simulation time (Simulator.tran)\n
+     -step: latest time step\n
+     -steps: number of progress lines seen so far\n
+     -min_step, max_step, mean_step: time step statistics over the progress lines seen so far\n
+     -waves: for 'waves' events, a dictionary of (x, y) keyed on wave name\n
+    '''
+    def __init__(self, kind, time=None, duration=None, step=None, steps=0, min_step=None, max_step=None, mean_step=None, waves=None):
+        self.kind = kind
+        self.time = time
+        self.duration = duration
+        self.step = step
+        self.steps = steps
+        self.min_step = min_step
+        self.max_step = max_step
+        self.mean_step = mean_step
+        self.waves = waves
+
+    @property
+    def fraction(self):
+        if self.time is None or not self.duration:
+            return None
+        return self.time / self.duration
+
+    def __repr__(self):
+        if self.kind == 'waves':
+            return f'MonitorEvent(waves, {list(self.waves.keys())})'
+        return f'MonitorEvent({self.kind}, time={self.time}, duration={self.duration}, step={self.step})'
+
+
+class SimulationMonitor:
+    '''
+    Follows a running transient by tailing spectre.out and the psf file spectre is writing.\n
+    Use with asyncio while Simulator.run executes in a thread (see watch), or iterate events() yourself.\n
+     -sim: the Simulator being run\n
+     -interval: seconds between polls\n
+     -wave_interval: seconds between partial wave reads, None to only report progress\n
+     -psf_dir: directory spectre writes to, defaults to sim.psf_dir\n
+    '''
+    def __init__(self, sim, interval=1.0, wave_interval=10.0, psf_dir=None):
+        self.sim = sim
+        self.interval = interval
+        self.wave_interval = wave_interval
+        self.psf_dir = psf_dir if psf_dir is not None else sim.psf_dir
+        self.log_filename = os.path.join(self.psf_dir, 'spectre.out')
+
+        self.pid = None
+        self.aborted = False
+        self.reset()
+
+    def reset(self):
+        self.time = None
+        self.step = None
+        self.steps = 0
+        self.min_step = None
+        self.max_step = None
+        self.step_sum = 0.
+        self.log_pos = 0
+        self.log_inode = None
+        self.partial = b''
+        # (inode, mtime, size) of a spectre.out left by a previous run, ignored until it changes
+        self.stale = None
+        # modification time of the psf results of a previous run
+        self.stale_waves = None
+
+    def event(self, kind, waves=None):
+        return MonitorEvent(kind, self.time, self.sim.duration, self.step, self.steps, self.min_step, self.max_step,
+                            self.step_sum / self.steps if self.steps > 0 else None, waves)
+
+    # reads the lines appended to spectre.out since the last call
+    def read_log(self):
+        if not os.path.isfile(self.log_filename):
+            return []
+
+        st = os.stat(self.log_filename)
+        if self.stale is not None:
+            if self.stale == (st.st_ino, st.st_mtime_ns, st.st_size):
+                return []
+            self.stale = None
+            self.log_inode = st.st_ino
+
+        # a new run replaced the file
+        if st.st_ino != self.log_inode or st.st_size < self.log_pos:
+            self.log_inode = st.st_ino
+            self.log_pos = 0
+            self.partial = b''
+
+        with open(self.log_filename, 'rb') as f:
+            f.seek(self.log_pos)
+            data = f.read()
+        self.log_pos += len(data)
+
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        return [l.decode(errors='replace') for l in lines]
+
+    # updates the progress state from new spectre.out lines, returns True if there was progress
+    def update(self, lines):
+        progress = False
+        for l in lines:
+            if self.pid is None:
+                self.pid = parse_pid(l)
+
+            p = parse_progress(l)
+            if p is None:
+                continue
+
+            progress = True
+            self.time = p['time']
+            self.step = p['step']
+            self.steps += 1
+            self.step_sum += p['step']
+            self.min_step = p['step'] if self.min_step is None else min(self.min_step, p['step'])
+            self.max_step = p['step'] if self.max_step is None else max(self.max_step, p['step'])
+        return progress
+
+    def read_waves(self):
+        """
+        Read the tracked waves from the psf file spectre is writing.
+        Returns a dictionary of (x, y) keyed on wave name or None if nothing has been written yet.
+        """
+        # during a parametric run the latest sweep point is shown
+        filenames = psf.find_result_files(self.psf_dir, 'tran')
+        if len(filenames) == 0:
+            return None
+        filename = filenames[-1]
+        if self.stale_waves is not None and os.path.getmtime(filename) == self.stale_waves:
+            return None
+
+        try:
+            r = psf.read_psf(filename)
+        except (psf.PSFError, ValueError, OSError):
+            # caught in the middle of a write, try again on the next poll
+            return None
+
+        if r.sweep_values is None or len(r.sweep_values) == 0:
+            return None
+
+        waves = {}
+        for name, w in self.sim.waves.items():
+            if 'fn' in w:
+                continue
+            psf_name = psf.signal_name(name, w.get('save', 'v'))
+            if psf_name in r:
+                waves[name] = (r.sweep_values, r[psf_name][:len(r.sweep_values)])
+        return waves
+
+    async def events(self, done=None):
+        """
+        Asynchronously yield MonitorEvents until done is set (an asyncio.Event or a future) or the simulation is aborted.
+
+        Parameters
+        ----------
+        done : asyncio.Event or future
+            signals that the simulation finished, None to monitor until the requested duration is reached
+        """
+        last_waves = None
+        while True:
+            finished = done is not None and (done.is_set() if isinstance(done, asyncio.Event) else done.done())
+
+            if self.update(self.read_log()):
+                yield self.event('progress')
+
+            now = asyncio.get_running_loop().time()
+            if self.wave_interval is not None and (finished or last_waves is None or now - last_waves >= self.wave_interval):
+                last_waves = now
+                waves = self.read_waves()
+                if waves is not None and len(waves) > 0:
+                    yield self.event('waves', waves)
+
+            if finished or self.aborted:
+                break
+            if done is None and self.time is not None and self.sim.duration is not None and self.time >= self.sim.duration:
+                break
+
+            await asyncio.sleep(self.interval)
+
+        yield self.event('done')
+
+    def abort(self, sig=signal.SIGTERM):
+        """
+        Stop the running spectre process. Simulator.run then returns None as for a failed simulation.
+        """
+        if self.pid is None:
+            self.update(self.read_log())
+        if self.pid is None:
+            raise Exception(f'No spectre process id found in {self.log_filename}')
+
+        try:
+            os.kill(self.pid, sig)
+        except ProcessLookupError:
+            return False
+
+        self.aborted = True
+        if self.sim.verbose:
+            print(f'Aborted spectre (process id: {self.pid})')
+        return True
+
+    async def watch(self, callback=None, **run_args):
+        """
+        Run the simulation in a thread and monitor it. Returns the return value of Simulator.run.
+
+        Parameters
+        ----------
+        callback : function
+            called with every MonitorEvent, may call abort() (eg. if the time step collapses)
+        run_args :
+            passed on to Simulator.run (eg. p_values)
+        """
+        self.reset()
+        self.pid = None
+        self.aborted = False
+
+        # spectre.out of a previous run should not be mistaken for this one
+        if os.path.isfile(self.log_filename):
+            st = os.stat(self.log_filename)
+            self.stale = (st.st_ino, st.st_mtime_ns, st.st_size)
+        filenames = psf.find_result_files(self.psf_dir, 'tran')
+        if len(filenames) > 0:
+            self.stale_waves = os.path.getmtime(filenames[-1])
+
+        loop = asyncio.get_running_loop()
+        run = loop.run_in_executor(None, lambda: self.sim.run(**run_args))
+
+        async for e in self.events(run):
+            if callback is not None:
+                callback(e)
+            elif self.sim.verbose and e.kind == 'progress':
+                print(f'{e.time:.4g}s / {e.duration:.4g}s ({100 * e.fraction:.1f}%), step {e.step:.3g}s')
+
+        return await run
@@ -0,0 +1,663 @@
+# Reader for spectre PSF result files (binary and ASCII) that does not need Virtuoso
+# binary layout follows libpsf: https://github.com/henjo/libpsf
+import mmap
+import os
+import struct
+
+import numpy as np
+import regex as re
+
+
+class PSFError(Exception):
+    pass
+
+
+# section ids in the table of contents at the end of a binary file
+SECTION_HEADER = 0
+SECTION_TYPE = 1
+SECTION_SWEEP = 2
+SECTION_TRACE = 3
+SECTION_VALUE = 4
+
+# chunk ids
+CHUNK_MAJOR_SECTION = 21
+CHUNK_MINOR_SECTION = 22
+CHUNK_DEF = 16
+CHUNK_GROUP = 17
+CHUNK_STRUCT_END = 18
+CHUNK_INDEX = 19
+CHUNK_ZERO_PAD = 20
+CHUNK_PROP_STRING = 33
+CHUNK_PROP_INT = 34
+CHUNK_PROP_DOUBLE = 35
+
+# data type ids
+TYPE_INT8 = 1
+TYPE_STRING = 2
+TYPE_ARRAY = 3
+TYPE_INT32 = 5
+TYPE_DOUBLE = 11
+TYPE_COMPLEX = 12
+TYPE_STRUCT = 16
+
+# numpy dtypes of the fixed size data types, binary psf is big endian
+_binary_dtypes = {
+    TYPE_INT8: '>i4',
+    TYPE_INT32: '>i4',
+    TYPE_DOUBLE: '>f8',
+    TYPE_COMPLEX: '>c16',
+}
+
+
+class _PSFType:
+    def __init__(self, id, name, data_type, children=None, props=None):
+        self.id = id
+        self.name = name
+        self.data_type = data_type
+        self.children = children if children is not None else []
+        self.props = props if props is not None else {}
+
+    @property
+    def size(self):
+        if self.data_type == TYPE_STRUCT:
+            return sum(c.size for c in self.children)
+        if self.data_type not in _binary_dtypes:
+            raise PSFError(f"Unsupported PSF data type {self.data_type} for '{self.name}'")
+        return np.dtype(_binary_dtypes[self.data_type]).itemsize
+
+
+class _PSFTrace:
+    def __init__(self, id, name, type_id, children=None, props=None):
+        self.id = id
+        self.name = name
+        self.type_id = type_id
+        self.children = children
+        self.props = props if props is not None else {}
+
+    @property
+    def is_group(self):
+        return self.children is not None
+
+
+class PSFFile:
+    '''
+    A single PSF result file.\n
+     -header: dictionary of header properties\n
+     -sweep_name: name of the swept variable (eg. 'time') or None\n
+     -sweep_values: numpy array of the swept variable\n
+     -values: dictionary of numpy arrays (swept files) or scalars (non swept files) keyed on signal name\n
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.header = {}
+        self.types = {}
+        self.sweep_name = None
+        self.sweep_values = None
+        self.values = {}
+        self.units = {}
+        self.complete = True
+
+    @property
+    def names(self):
+        return list(self.values.keys())
+
+    def __contains__(self, name):
+        return name in self.values
+
+    def __getitem__(self, name):
+        try:
+            return self.values[name]
+        except KeyError:
+            raise PSFError(f"Signal '{name}' is not in {self.filename}. Available signals: {self.names}")
+
+    def __len__(self):
+        return len(self.values)
+
+
+def is_ascii(filename):
+    with open(filename, 'rb') as f:
+        return f.read(6) == b'HEADER'
+
+
+def read_psf(filename):
+    """
+    Read a PSF binary or PSF ASCII file. Files which are still being written by spectre
+    are read up to the last complete point and have complete set to False.
+
+    Parameters
+    ----------
+    filename : string
+        path to the PSF file (eg. './sim_output/inverter/psf/tran.tran.tran')
+    """
+    if os.path.getsize(filename) == 0:
+        raise PSFError(f'{filename} is empty')
+
+    with open(filename, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mm[:6] == b'HEADER':
+        return _ASCIIReader(filename, mm).read()
+    return _BinaryReader(filename, mm).read()
+
+
+class _BinaryReader:
+    def __init__(self, filename, mm):
+        self.psf = PSFFile(filename)
+        self.buf = mm
+        self.traces = []
+        self.sweeps = []
+
+    def int32(self, pos):
+        return struct.unpack_from('>i', self.buf, pos)[0], pos + 4
+
+    def double(self, pos):
+        return struct.unpack_from('>d', self.buf, pos)[0], pos + 8
+
+    def string(self, pos):
+        n, pos = self.int32(pos)
+        s = bytes(self.buf[pos:pos + n]).decode(errors='replace')
+        # strings are padded to 4 bytes
+        return s, pos + ((n + 3) & ~3)
+
+    def expect(self, pos, chunk):
+        c, pos = self.int32(pos)
+        if c != chunk:
+            raise PSFError(f'{self.psf.filename}: expected chunk {chunk} at byte {pos - 4}, found {c}')
+        return pos
+
+    # returns the table of contents {section id: offset} or None if the file is incomplete
+    def sections(self):
+        size = len(self.buf)
+        if size < 12 or self.buf[size - 12:size - 4] != b'Clarissa':
+            return None
+
+        data_size, _ = self.int32(size - 4)
+        n_sections = (size - data_size - 12) // 8
+        toc = size - 12 - n_sections * 8
+        sections = {}
+        for i in range(n_sections):
+            sid, _ = self.int32(toc + 8 * i)
+            offset, _ = self.int32(toc + 8 * i + 4)
+            sections[sid] = offset
+        return sections
+
+    def properties(self, pos, end):
+        props = {}
+        while pos < end:
+            chunk, _ = self.int32(pos)
+            if chunk not in [CHUNK_PROP_STRING, CHUNK_PROP_INT, CHUNK_PROP_DOUBLE]:
+                break
+            name, pos = self.string(pos + 4)
+            if chunk == CHUNK_PROP_STRING:
+                props[name], pos = self.string(pos)
+            elif chunk == CHUNK_PROP_INT:
+                props[name], pos = self.int32(pos)
+            else:
+                props[name], pos = self.double(pos)
+        return props, pos
+
+    def read(self):
+        sections = self.sections()
+        self.psf.complete = sections is not None
+
+        if sections is None:
+            # file is still being written, sections are in order after the first word
+            sections = {}
+            pos = 4
+            order = [SECTION_HEADER, SECTION_TYPE, SECTION_SWEEP, SECTION_TRACE, SECTION_VALUE]
+            for sid in order:
+                if pos + 8 > len(self.buf):
+                    break
+                if sid == SECTION_SWEEP and self.psf.header.get('PSF sweeps', 0) == 0:
+                    continue
+                if sid == SECTION_TRACE and self.psf.header.get('PSF traces', 0) == 0:
+                    continue
+                sections[sid] = pos
+                end = self.read_section(sid, pos)
+                if end is None:
+                    break
+                pos = end
+        else:
+            for sid in sorted(sections):
+                self.read_section(sid, sections[sid])
+
+        return self.psf
+
+    # returns the end of the section or None if it is truncated
+    def read_section(self, sid, pos):
+        pos = self.expect(pos, CHUNK_MAJOR_SECTION)
+        end, pos = self.int32(pos)
+        if end > len(self.buf) or end < pos:
+            if sid != SECTION_VALUE:
+                raise PSFError(f'{self.psf.filename}: section {sid} is truncated')
+            end = len(self.buf)
+
+        if sid == SECTION_HEADER:
+            self.psf.header, _ = self.properties(pos, end)
+        elif sid == SECTION_TYPE:
+            self.read_types(pos, end)
+        elif sid == SECTION_SWEEP:
+            self.read_sweeps(pos, end)
+        elif sid == SECTION_TRACE:
+            self.read_traces(pos, end)
+        elif sid == SECTION_VALUE:
+            if len(self.sweeps) == 0:
+                self.read_nonsweep_values(pos, end)
+            elif 'PSF window size' in self.psf.header:
+                self.read_windowed_values(pos, end)
+            else:
+                self.read_simple_values(pos, end)
+
+        if end >= len(self.buf) and sid == SECTION_VALUE:
+            return None
+        return end
+
+    def read_type(self, pos, end):
+        pos = self.expect(pos, CHUNK_DEF)
+        tid, pos = self.int32(pos)
+        name, pos = self.string(pos)
+        _, pos = self.int32(pos)  # array type
+        data_type, pos = self.int32(pos)
+
+        children = []
+        if data_type == TYPE_STRUCT:
+            while True:
+                chunk, _ = self.int32(pos)
+                if chunk == CHUNK_STRUCT_END:
+                    pos += 4
+                    break
+                child, pos = self.read_type(pos, end)
+                children.append(child)
+
+        props, pos = self.properties(pos, end)
+        return _PSFType(tid, name, data_type, children, props), pos
+
+    def read_types(self, pos, end):
+        pos = self.expect(pos, CHUNK_MINOR_SECTION)
+        sub_end, pos = self.int32(pos)
+        while pos < sub_end:
+            t, pos = self.read_type(pos, sub_end)
+            self.psf.types[t.id] = t
+
+    def read_sweeps(self, pos, end):
+        while pos < end:
+            pos = self.expect(pos, CHUNK_DEF)
+            sid, pos = self.int32(pos)
+            name, pos = self.string(pos)
+            _, pos = self.int32(pos)  # parameter type
+            type_id, pos = self.int32(pos)
+            props, pos = self.properties(pos, end)
+            self.sweeps.append(_PSFTrace(sid, name, type_id, props=props))
+        self.psf.sweep_name = self.sweeps[0].name
+
+    def read_trace(self, pos, end):
+        chunk, pos = self.int32(pos)
+        tid, pos = self.int32(pos)
+        name, pos = self.string(pos)
+        if chunk == CHUNK_GROUP:
+            n_children, pos = self.int32(pos)
+            children = []
+            for _ in range(n_children):
+                child, pos = self.read_trace(pos, end)
+                children.append(child)
+            return _PSFTrace(tid, name, None, children), pos
+        if chunk != CHUNK_DEF:
+            raise PSFError(f'{self.psf.filename}: unexpected chunk {chunk} in trace section')
+        type_id, pos = self.int32(pos)
+        props, pos = self.properties(pos, end)
+        return _PSFTrace(tid, name, type_id, props=props), pos
+
+    def read_traces(self, pos, end):
+        pos = self.expect(pos, CHUNK_MINOR_SECTION)
+        sub_end, pos = self.int32(pos)
+        while pos < sub_end:
+            t, pos = self.read_trace(pos, sub_end)
+            self.traces.append(t)
+
+    def leaf_traces(self):
+        leaves = []
+        for t in self.traces:
+            leaves += t.children if t.is_group else [t]
+        return leaves
+
+    def trace_type(self, trace):
+        t = self.psf.types[trace.type_id]
+        if t.data_type not in _binary_dtypes:
+            raise PSFError(f"{self.psf.filename}: '{trace.name}' has unsupported type {t.name}")
+        self.psf.units[trace.name] = t.props.get('units', trace.props.get('units'))
+        return t
+
+    # non windowed sweeps store one record per point:
+    #   [16, sweep id, sweep value] then [16, trace id, value(s)] for each trace or group
+    # every record has the same layout, so the whole section is viewed as one strided numpy array
+    def read_simple_values(self, pos, end):
+        sweep_type = self.psf.types[self.sweeps[0].type_id]
+        fields = {'names': [], 'formats': [], 'offsets': []}
+
+        rec = pos + 8
+        fields['names'].append(self.sweeps[0].name)
+        fields['formats'].append(_binary_dtypes[sweep_type.data_type])
+        fields['offsets'].append(rec - pos)
+        rec += sweep_type.size
+
+        by_id = {t.id: t for t in self.traces}
+        by_id.update({c.id: c for t in self.traces if t.is_group for c in t.children})
+        remaining = len(self.leaf_traces())
+        while remaining > 0:
+            rec = self.expect(rec, CHUNK_DEF)
+            tid, rec = self.int32(rec)
+            if tid not in by_id:
+                raise PSFError(f'{self.psf.filename}: unknown trace id {tid} in value section')
+            trace = by_id[tid]
+            for leaf in (trace.children if trace.is_group else [trace]):
+                t = self.trace_type(leaf)
+                fields['names'].append(leaf.name)
+                fields['formats'].append(_binary_dtypes[t.data_type])
+                fields['offsets'].append(rec - pos)
+                rec += t.size
+                remaining -= 1
+
+        fields['itemsize'] = rec - pos
+        n_points = (end - pos) // fields['itemsize']
+        records = np.ndarray((n_points,), dtype=np.dtype(fields), buffer=self.buf, offset=pos)
+
+        self.psf.sweep_values = records[self.sweeps[0].name]
+        for name in fields['names'][1:]:
+            self.psf.values[name] = records[name]
+
+    # windowed sweeps store blocks of points:
+    #   [16, n_points] n_points sweep values, then one window per trace with the values right aligned
+    def read_windowed_values(self, pos, end):
+        window_size = self.psf.header['PSF window size']
+        sweep_type = self.psf.types[self.sweeps[0].type_id]
+        leaves = self.leaf_traces()
+        types = [self.trace_type(t) for t in leaves]
+
+        sweep_blocks = []
+        blocks = [[] for _ in leaves]
+        while pos + 8 <= end:
+            chunk, pos = self.int32(pos)
+            if chunk == CHUNK_ZERO_PAD:
+                pad, pos = self.int32(pos)
+                pos += pad
+                continue
+            if chunk != CHUNK_DEF:
+                break
+
+            n, pos = self.int32(pos)
+            n &= 0xffff
+            window_end = pos + n * sweep_type.size + len(leaves) * window_size
+            if window_end > end:
+                # last window is still being written
+                break
+
+            sweep_blocks.append(np.frombuffer(self.buf, _binary_dtypes[sweep_type.data_type], n, pos))
+            pos += n * sweep_type.size
+            for i, t in enumerate(types):
+                offset = pos + window_size - n * t.size
+                blocks[i].append(np.frombuffer(self.buf, _binary_dtypes[t.data_type], n, offset))
+                pos += window_size
+
+        dtype = _binary_dtypes[sweep_type.data_type]
+        self.psf.sweep_values = np.concatenate(sweep_blocks) if sweep_blocks else np.empty(0, dtype)
+        for leaf, t, b in zip(leaves, types, blocks):
+            self.psf.values[leaf.name] = np.concatenate(b) if b else np.empty(0, _binary_dtypes[t.data_type])
+
+    # non swept results (eg. dcOp) store [16, id, name, type id, value, properties] per signal
+    def read_nonsweep_values(self, pos, end):
+        pos = self.expect(pos, CHUNK_MINOR_SECTION)
+        sub_end, pos = self.int32(pos)
+        while pos < sub_end:
+            pos = self.expect(pos, CHUNK_DEF)
+            _, pos = self.int32(pos)
+            name, pos = self.string(pos)
+            type_id, pos = self.int32(pos)
+            t = self.psf.types[type_id]
+            pos, value = self.read_value(pos, t)
+            self.psf.values[name] = value
+            self.psf.units[name] = t.props.get('units')
+            _, pos = self.properties(pos, sub_end)
+
+    def read_value(self, pos, t):
+        if t.data_type == TYPE_STRING:
+            value, pos = self.string(pos)
+            return pos, value
+        if t.data_type == TYPE_STRUCT:
+            value = {}
+            for c in t.children:
+                pos, value[c.name] = self.read_value(pos, c)
+            return pos, value
+        return pos + t.size, np.frombuffer(self.buf, _binary_dtypes[t.data_type], 1, pos)[0]
+
+
+# tokens of a PSF ASCII file: quoted strings, parentheses and bare words/numbers
+_ascii_token = re.compile(rb'"(?:[^"\\]|\\.)*"|\(|\)|[^\s()"]+')
+
+
+class _ASCIIReader:
+    def __init__(self, filename, mm):
+        self.psf = PSFFile(filename)
+        self.buf = mm
+        self.type_kinds = {}
+        self.traces = []
+
+    def section_bounds(self):
+        bounds = {}
+        for name in [b'HEADER', b'TYPE', b'SWEEP', b'TRACE', b'VALUE', b'END']:
+            m = re.compile(rb'^' + name + rb'\s*$', re.M).search(self.buf)
+            if m is not None:
+                bounds[name.decode()] = (m.start(), m.end())
+        return bounds
+
+    def tokens(self, start, end):
+        return [t for t in _ascii_token.findall(self.buf, start, end)]
+
+    @staticmethod
+    def text(token):
+        if token[:1] == b'"':
+            return token[1:-1].decode(errors='replace')
+        return token.decode()
+
+    @staticmethod
+    def number(token):
+        try:
+            return int(token)
+        except ValueError:
+            return float(token)
+
+    @staticmethod
+    def skip_parens(tokens, i):
+        depth = 0
+        while i < len(tokens):
+            if tokens[i] == b'(':
+                depth += 1
+            elif tokens[i] == b')':
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            i += 1
+        return i
+
+    def read(self):
+        bounds = self.section_bounds()
+        self.psf.complete = 'END' in bounds
+        order = [s for s in ['HEADER', 'TYPE', 'SWEEP', 'TRACE', 'VALUE', 'END'] if s in bounds]
+        ends = {s: (bounds[n][0] if n is not None else len(self.buf)) for s, n in zip(order, order[1:] + [None])}
+
+        if 'HEADER' in bounds:
+            self.read_header(self.tokens(bounds['HEADER'][1], ends['HEADER']))
+        if 'TYPE' in bounds:
+            self.read_types(self.tokens(bounds['TYPE'][1], ends['TYPE']))
+        if 'SWEEP' in bounds:
+            tokens = self.tokens(bounds['SWEEP'][1], ends['SWEEP'])
+            self.psf.sweep_name = self.text(tokens[0])
+        if 'TRACE' in bounds:
+            self.read_traces(self.tokens(bounds['TRACE'][1], ends['TRACE']))
+        if 'VALUE' in bounds:
+            if self.psf.sweep_name is None:
+                self.read_nonsweep_values(self.tokens(bounds['VALUE'][1], ends['VALUE']))
+            else:
+                self.read_sweep_values(bounds['VALUE'][1], ends['VALUE'])
+        return self.psf
+
+    def read_header(self, tokens):
+        for name, value in zip(tokens[::2], tokens[1::2]):
+            self.psf.header[self.text(name)] = self.text(value) if value[:1] == b'"' else self.number(value)
+
+    # "name" FLOAT DOUBLE PROP( "units" "V" ) or "name" COMPLEX DOUBLE or "name" STRUCT( ... )
+    def read_types(self, tokens):
+        i = 0
+        while i < len(tokens):
+            name = self.text(tokens[i])
+            i += 1
+            kind = tokens[i].decode()
+            props = {}
+            while i < len(tokens) and tokens[i][:1] != b'"':
+                if tokens[i] == b'PROP':
+                    j = self.skip_parens(tokens, i + 1)
+                    p = tokens[i + 2:j - 1]
+                    props = {self.text(k): self.text(v) for k, v in zip(p[::2], p[1::2])}
+                    i = j
+                elif tokens[i] == b'(':
+                    i = self.skip_parens(tokens, i)
+                else:
+                    i += 1
+            self.type_kinds[name] = kind
+            self.psf.types[name] = _PSFType(name, name, kind, props=props)
+
+    # "name" "type" or "group" GROUP n followed by n traces
+    def read_traces(self, tokens):
+        i = 0
+        while i < len(tokens):
+            name = self.text(tokens[i])
+            if tokens[i + 1] == b'GROUP':
+                i += 3
+            else:
+                type_name = self.text(tokens[i + 1])
+                self.traces.append(_PSFTrace(name, name, type_name))
+                self.psf.units[name] = self.psf.types[type_name].props.get('units') if type_name in self.psf.types else None
+                i += 2
+            if i < len(tokens) and tokens[i] == b'PROP':
+                i = self.skip_parens(tokens, i + 1)
+
+    def read_sweep_values(self, start, end):
+        names = [self.psf.sweep_name] + [t.name for t in self.traces]
+        simple = all(self.type_kinds.get(t.type_id) == 'FLOAT' for t in self.traces)
+
+        if simple:
+            # every point is "sweep" value "trace" value ..., so the tokens reshape into a table
+            tokens = bytes(self.buf[start:end]).split()
+            n_points = len(tokens) // (2 * len(names))
+            table = np.asarray(tokens[:n_points * 2 * len(names)]).reshape(n_points, len(names), 2)
+            columns = table[:, :, 1].astype(float)
+        else:
+            tokens = self.tokens(start, end)
+            rows = []
+            i = 0
+            while i < len(tokens):
+                row = []
+                for _ in names:
+                    # skip the signal name
+                    i += 1
+                    if i < len(tokens) and tokens[i] == b'(' and i + 3 < len(tokens):
+                        row.append(complex(float(tokens[i + 1]), float(tokens[i + 2])))
+                        i += 4
+                    elif i < len(tokens) and tokens[i] != b'(':
+                        row.append(float(tokens[i]))
+                        i += 1
+                    else:
+                        break
+                if len(row) != len(names):
+                    # last point is still being written
+                    break
+                rows.append(row)
+            columns = np.asarray(rows) if rows else np.empty((0, len(names)))
+
+        self.psf.sweep_values = columns[:, 0]
+        for j, name in enumerate(names[1:]):
+            self.psf.values[name] = columns[:, j + 1]
+
+    # "name" "type" value PROP( ... )
+    def read_nonsweep_values(self, tokens):
+        i = 0
+        while i + 2 < len(tokens):
+            name = self.text(tokens[i])
+            type_name = self.text(tokens[i + 1])
+            i += 2
+            if tokens[i] == b'(':
+                j = self.skip_parens(tokens, i)
+                parts = [self.number(t) for t in tokens[i + 1:j - 1]]
+                value = complex(*parts) if len(parts) == 2 else parts
+                i = j
+            else:
+                value = self.text(tokens[i]) if tokens[i][:1] == b'"' else self.number(tokens[i])
+                i += 1
+            if i < len(tokens) and tokens[i] == b'PROP':
+                i = self.skip_parens(tokens, i + 1)
+            self.psf.values[name] = value
+            self.psf.units[name] = self.psf.types[type_name].props.get('units') if type_name in self.psf.types else None
+
+
+def find_result_file(directory, analysis='tran'):
+    """
+    Find the result file of an analysis in a psf directory (eg. tran.tran or tran.tran.tran).
+    Returns None if there is no such file.
+    """
+    if not os.path.isdir(directory):
+        return None
+    candidates = [f for f in os.listdir(directory)
+                  if f.startswith(analysis + '.') and f.endswith('.' + analysis) and os.path.isfile(os.path.join(directory, f))]
+    if len(candidates) == 0:
+        return None
+    return os.path.join(directory, sorted(candidates, key=len)[0])
+
+
+def _sweep_dirs(directory):
+    dirs = [d for d in os.listdir(directory) if d.isdigit() and os.path.isdir(os.path.join(directory, d))]
+    return [os.path.join(directory, d) for d in sorted(dirs, key=int)]
+
+
+def find_result_files(directory, analysis='tran'):
+    """
+    Find the result files of an analysis in a psf directory. Parametric sweeps write each
+    sweep point to a numbered sub directory, these are returned in sweep order.
+    """
+    f = find_result_file(directory, analysis)
+    if f is not None:
+        return [f]
+
+    files = []
+    if os.path.isdir(directory):
+        for d in _sweep_dirs(directory):
+            files += find_result_files(d, analysis)
+    return files
+
+
+def load_results(directory, analysis='tran'):
+    """
+    Read every sweep point of an analysis from a psf directory.
+
+    Parameters
+    ----------
+    directory : string
+        psf directory (eg. './sim_output/inverter/psf')
+    analysis : string
+        analysis name (eg. 'tran')
+
+    Returns a list of PSFFile, one per sweep point
+    """
+    files = find_result_files(directory, analysis)
+    if len(files) == 0:
+        raise PSFError(f"No '{analysis}' results found in {directory}")
+    return [read_psf(f) for f in files]
+
+
+def signal_name(name, signal_type='v'):
+    """
+    Convert a Virtuoso signal name to the name used in PSF files.
+    '/out' -> 'out', '/I0/out' -> 'I0.out', and for currents '/I0/M1/D' -> 'I0.M1:D'
+    """
+    parts = name.strip('/').split('/')
+    if signal_type == 'i' and len(parts) > 1:
+        return '.'.join(parts[:-1]) + ':' + parts[-1]
+    return '.'.join(parts)
@@ -0,0 +1,111 @@
+import os
+import tempfile
+
+import numpy as np
+
+from .cdf_cache import evaluate, skill
+from .instance import inst_vpos
+
+
+def _value(v):
+    if isinstance(v, np.ndarray):
+        v = v.tolist()
+    elif isinstance(v, tuple):
+        v = list(v)
+    return skill(v)
+
+
+def _call(fn, *args):
+    return f"{fn}({' '.join(_value(a) for a in args)})"
+
+
+def compile_schematic(d, procedure='guruReplay'):
+    """
+    Compile a schematic description (Schematic.__dict__()) into SKILL code defining procedure(cv),
+    which creates every instance, parameter, pin, wire, label and note of the description in cv.
+
+    Parameters
+    ----------
+    d : dict
+        schematic description (eg. sch.__dict__() or one loaded from json)
+    procedure : string
+        name of the SKILL procedure to define
+    """
+    masters = {}
+    body = []
+
+    def master(lib_name, cell_name):
+        key = (lib_name, cell_name)
+        if key not in masters:
+            masters[key] = f'm{len(masters)}'
+            body.append(f'{masters[key]} = {_call("dbOpenCellViewByType", lib_name, cell_name, "symbol")}')
+        return masters[key]
+
+    applied = d.get('instances', {})
+    for lib_name, cell_name, pos, name, rot in d['instances_params']:
+        m = master(lib_name, cell_name)
+        vpos = inst_vpos(cell_name, pos)
+        body.append(f'inst = schCreateInst(cv {m} {_value(name)} {_value(vpos)} {_value(rot)})')
+
+        params = applied.get(name, {})
+        if len(params) > 0:
+            body.append('cdf = cdfGetInstCDF(inst)')
+            for p_name, p_value in params.items():
+                body.append(f'when(param = cdfFindParamByName(cdf {_value(p_name)}) param->value = {_value(p_value)})')
+
+    for cell_name, *pin_params in d['pins']:
+        m = master('basic', cell_name)
+        body.append(f'schCreatePin(cv {m} {" ".join(_value(a) for a in pin_params)})')
+
+    for wire_params, label_params in d['wires']:
+        body.append(f'wire = schCreateWire(cv {" ".join(_value(a) for a in wire_params)})')
+        if label_params is not None:
+            body.append(f'when(wire schCreateWireLabel(cv car(wire) {" ".join(_value(a) for a in label_params)}))')
+
+    for note_params in d['notes']:
+        body.append(f'schCreateNoteLabel(cv {" ".join(_value(a) for a in note_params)})')
+
+    local_vars = ' '.join(['inst', 'cdf', 'param', 'wire'] + list(masters.values()))
+    lines = [f'procedure({procedure}(cv)', f'  let(({local_vars})']
+    lines += [f'    {b}' for b in body]
+    lines += ['    t))', '']
+    return '\n'.join(lines)
+
+
+def write_schematic(d, filename, procedure='guruReplay'):
+    """
+    Write the compiled schematic description to a .il file, see compile_schematic.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    with open(filename, 'w') as f:
+        f.write(compile_schematic(d, procedure))
+    return filename
+
+
+def load_schematic(ws, cv, d, filename=None, procedure='guruReplay'):
+    """
+    Create the contents of a schematic description in cv in one call to Virtuoso.
+
+    Parameters
+    ----------
+    filename : string
+        .il file Virtuoso loads the compiled description from, it must be readable by Virtuoso.
+        None sends the code with the call, descriptions too long for one skillbridge call
+        are written to a temporary .il file instead.
+    """
+    if filename is not None:
+        write_schematic(d, filename, procedure)
+        return evaluate(ws, f'progn({_call("load", os.path.abspath(filename))} {procedure}({skill(cv)}))')
+
+    code = compile_schematic(d, procedure)
+    # same margin as SkillBatch, the call adds its own framing to the code
+    if len(code) <= ws.max_transmission_length // 2:
+        return evaluate(ws, f'progn({code} {procedure}({skill(cv)}))')
+
+    fd, tmp_filename = tempfile.mkstemp(prefix='guru_replay_', suffix='.il')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(code)
+        return evaluate(ws, f'progn({_call("load", tmp_filename)} {procedure}({skill(cv)}))')
+    finally:
+        os.remove(tmp_filename)
@@ -0,0 +1,148 @@
+import numpy as np
+
+
+class SweepResult:
+    '''
+    Simulation results stored as dense arrays with one row per sweep point.\n
+     -x: (sweep point, time) array of x values\n
+     -waves: dictionary of (sweep point, time) arrays keyed on wave name\n
+     -coords: dictionary of parameter values for each sweep point keyed on parameter name\n
+     -lengths: number of valid samples in each row, rows shorter than the longest are padded with nan\n
+    '''
+    def __init__(self, x, waves, coords=None, lengths=None):
+        self.x = np.atleast_2d(x)
+        self.waves = {name: np.atleast_2d(y) for name, y in waves.items()}
+
+        self.coords = {}
+        if coords is not None:
+            for p, v in coords.items():
+                self.coords[p] = np.asarray(v)
+                if len(self.coords[p]) != len(self):
+                    raise Exception(f"Parameter '{p}' has {len(self.coords[p])} values for {len(self)} sweep points")
+
+        if lengths is None:
+            lengths = np.full(len(self), self.x.shape[1])
+        self.lengths = np.asarray(lengths)
+
+    @classmethod
+    def from_lists(cls, x, waves, param_sets=None, align='pad'):
+        """
+        Build a SweepResult from the per sweep point lists produced by a parametric run.
+
+        Parameters
+        ----------
+        x : list of np arrays
+            x values of each sweep point
+        waves : dictionary of lists of np arrays
+            y values of each sweep point keyed on wave name
+        param_sets : dictionary
+            parameter values of each sweep point (eg. {'w_read' : [1e-6, 2.5e-6]})
+        align : string
+            'pad' - keep the original samples, shorter rows are padded with nan
+            'interp' - interpolate every row onto the sorted union of all x values
+        """
+        x = [np.asarray(x_i, dtype=float) for x_i in x]
+        lengths = np.asarray([len(x_i) for x_i in x])
+        n_points = len(x)
+
+        same_x = np.all(lengths == lengths[0]) and all(np.array_equal(x[0], x_i) for x_i in x[1:])
+
+        if same_x:
+            dense_x = np.stack(x)
+            dense = {name: np.stack([np.asarray(y_i) for y_i in y]) for name, y in waves.items()}
+        elif align == 'pad':
+            n = lengths.max()
+            dense_x = np.full((n_points, n), np.nan)
+            for i, x_i in enumerate(x):
+                dense_x[i, :lengths[i]] = x_i
+
+            dense = {}
+            for name, y in waves.items():
+                dtype = np.result_type(*[np.asarray(y_i).dtype for y_i in y], np.float64)
+                dense[name] = np.full((n_points, n), np.nan, dtype=dtype)
+                for i, y_i in enumerate(y):
+                    dense[name][i, :len(y_i)] = y_i
+        elif align == 'interp':
+            shared_x = np.unique(np.concatenate(x))
+            dense_x = np.broadcast_to(shared_x, (n_points, len(shared_x)))
+            dense = {}
+            for name, y in waves.items():
+                dense[name] = np.stack([np.interp(shared_x, x_i, y_i) for x_i, y_i in zip(x, y)])
+            lengths = np.full(n_points, len(shared_x))
+        else:
+            raise Exception(f"Invalid align: {align}. Use one of: ['pad', 'interp']")
+
+        coords = None
+        if param_sets is not None:
+            coords = {p: v for p, v in param_sets.items() if len(v) == n_points}
+
+        return cls(dense_x, dense, coords, lengths)
+
+    @property
+    def names(self):
+        return list(self.waves.keys())
+
+    @property
+    def params(self):
+        return list(self.coords.keys())
+
+    def __len__(self):
+        return self.x.shape[0]
+
+    def __contains__(self, name):
+        return name in self.waves
+
+    def __getitem__(self, name):
+        try:
+            return self.waves[name]
+        except KeyError:
+            raise Exception(f"Wave '{name}' does not exist. Available waves: {self.names}")
+
+    def __setitem__(self, name, y):
+        y = np.atleast_2d(y)
+        if y.shape[0] != len(self):
+            raise Exception(f"Wave '{name}' has {y.shape[0]} sweep points, expected {len(self)}")
+        self.waves[name] = y
+
+    def isel(self, index):
+        """
+        Select sweep points by position (int, slice, list of ints or boolean mask).
+        """
+        if isinstance(index, (int, np.integer)):
+            index = [index]
+        return SweepResult(self.x[index],
+                           {name: y[index] for name, y in self.waves.items()},
+                           {p: v[index] for p, v in self.coords.items()},
+                           self.lengths[index])
+
+    def mask(self, **params):
+        """
+        Boolean mask of the sweep points matching every given parameter value.
+        """
+        m = np.ones(len(self), dtype=bool)
+        for p, value in params.items():
+            if p not in self.coords:
+                raise Exception(f"'{p}' is not a sweep parameter. Available parameters: {self.params}")
+            v = self.coords[p]
+            if np.issubdtype(v.dtype, np.number) and not isinstance(value, str):
+                m &= np.isclose(v, value)
+            else:
+                m &= v == value
+        return m
+
+    def sel(self, **params):
+        """
+        Select sweep points by parameter value (eg. res.sel(w_read=2.5e-6)).
+        """
+        m = self.mask(**params)
+        if not np.any(m):
+            raise Exception(f'No sweep point matches {params}')
+        return self.isel(np.flatnonzero(m))
+
+    def label(self, index):
+        """
+        Legend label of a sweep point (eg. '[w_read, r1] = [1e-06, 300]').
+        """
+        if len(self.coords) == 0:
+            return str(index)
+        return f"[{', '.join(self.params)}] = {[self.coords[p][index].item() for p in self.params]}"
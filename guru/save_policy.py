@@ -0,0 +1,77 @@
+from . import psf
+
+
+class SavePolicy:
+    '''
+    Controls what spectre writes to the psf directory, applied by Simulator.run.\n
+     -mode: 'tracked' only the signals registered with track_net/track_pin/track_custom,
+            'depth' every signal down to depth levels of hierarchy, 'all' every signal\n
+     -depth: levels of hierarchy saved in 'depth' mode (1 is the top level)\n
+     -patterns: extra signals to save, wildcards allowed (eg. ['/I0/*', '/out*'])\n
+     -currents: terminal currents to save, 'selected', 'nonlinear' or 'all'\n
+     -pwr: power signals to save, 'none', 'total', 'subckts' or 'all' (the default, as saved before save policies)\n
+     -strobe_period: write the outputs every strobe_period seconds instead of every time step, None to disable\n
+    '''
+    def __init__(self, mode='tracked', depth=None, patterns=None, currents='selected', pwr='all', strobe_period=None):
+        if mode not in ['tracked', 'depth', 'all']:
+            raise Exception(f"Invalid save mode: {mode}. Use one of: ['tracked', 'depth', 'all']")
+        if mode == 'depth' and depth is None:
+            raise Exception("Save mode 'depth' needs a depth")
+        if currents not in ['selected', 'nonlinear', 'all']:
+            raise Exception(f"Invalid currents: {currents}. Use one of: ['selected', 'nonlinear', 'all']")
+        if pwr not in ['none', 'total', 'subckts', 'all']:
+            raise Exception(f"Invalid pwr: {pwr}. Use one of: ['none', 'total', 'subckts', 'all']")
+
+        self.mode = mode
+        self.depth = depth
+        self.patterns = list(patterns) if patterns is not None else []
+        self.currents = currents
+        self.pwr = pwr
+        self.strobe_period = strobe_period
+
+    # value of spectre's save option
+    @property
+    def save(self):
+        return {'tracked': 'selected', 'depth': 'lvlpub', 'all': 'allpub'}[self.mode]
+
+    def settings(self):
+        """
+        Dictionary of the policy settings (eg. for hashing into a cache key).
+        """
+        return {'mode': self.mode, 'depth': self.depth, 'patterns': self.patterns, 'currents': self.currents,
+                'pwr': self.pwr, 'strobe_period': self.strobe_period}
+
+    def options(self):
+        """
+        Spectre options enforcing the policy (eg. 'save=selected currents=selected pwr=none').
+        """
+        opts = f'save={self.save}'
+        if self.mode == 'depth':
+            opts += f' nestlvl={self.depth}'
+        return opts + f' currents={self.currents} pwr={self.pwr}'
+
+    def save_statements(self, waves):
+        """
+        Spectre save statements of the tracked waves and the wildcard patterns.
+
+        Parameters
+        ----------
+        waves : dictionary
+            Simulator.waves, custom waves are skipped
+        """
+        saves = [psf.signal_name(name, w.get('save', 'v')) for name, w in waves.items() if 'fn' not in w]
+        saves += [psf.signal_name(p) for p in self.patterns]
+
+        lines = []
+        if len(saves) > 0:
+            lines.append('save ' + ' '.join(saves))
+        return lines
+
+    def write_definitions(self, filename):
+        """
+        Write the wildcard saves to a spectre file for OCEAN's definitionFile. Returns True if there is anything to save.
+        """
+        with open(filename, 'w') as f:
+            for p in self.patterns:
+                f.write(f'save {psf.signal_name(p)}\n')
+        return len(self.patterns) > 0
@@ -1,19 +1,52 @@
-from .instance import _Inst, _Pin
-from .utils import snap_spacing, transform, convert_str_to_num, ConnPos
-
-from skillbridge import Workspace
+from .instance import _Inst, _InstArray, _LazyInst, _Pin
+from .utils import snap_spacing, transform, convert_strs_to_nums, ConnPos
+from .timing import Timings, timed
+from .batch import SkillBatch
+from .symbol_cache import default_symbol_cache, cell_timestamp, hierarchy_timestamps
+from .replay import load_schematic
+from .cdf_cache import default_cdf_cache, evaluate, read_values, skill
+from .sync import SchematicSync, sync_key
+
+from skillbridge import Workspace, Var
+from contextlib import contextmanager
 import numpy as np
+import hashlib
+import json
+import os
+
+
+def open_workspace(workspace="default"):
+    """
+    Workspace object of a workspace or workspace id, "default" opens '{$USER}_0'.
+    """
+    if not isinstance(workspace, str):
+        return workspace
+    if workspace == "default":
+        workspace = f"{os.getenv('USER')}_0"
+    return Workspace.open(workspace_id=workspace)
+
 
 class Schematic:
-    def __init__(self, workspace : Workspace, lib_name, cell_name, overwrite=False, verbose=True):
+    def __init__(self, workspace : Workspace, lib_name, cell_name, overwrite=False, verbose=True, sync=False,
+                 prune_untagged=False, read_only=False):
         self.ws = workspace
+        self.timings = Timings(self.ws)
 
         if self.ws.db.full_lib_path(lib_name) == None:
             self.lib_id = self.ws.db.create_lib(lib_name)
             
             print(f'Created library {lib_name}')
         
-        if overwrite:
+        if overwrite and sync:
+            raise Exception("overwrite and sync can not both be set, sync updates the existing schematic")
+        if read_only and (overwrite or sync):
+            raise Exception("read_only can not be combined with overwrite or sync")
+
+        # read only schematics (eg. for netlisting in another session) take no edit lock
+        if read_only:
+            self.cv = self.ws.db.open_cell_view_by_type(lib_name, cell_name, "schematic",
+                                          "schematic", "r")
+        elif overwrite:
             self.cv = self.ws.db.open_cell_view_by_type(lib_name, cell_name, "schematic",
                                           "schematic", "w")
         else:
@@ -35,6 +68,17 @@ class Schematic:
 
         self.param_vars = []
         self.cdf_ignore = []
+        # {instance name : [(parameter, applied value, database value), ...]} found by the last do_cdf_callbacks
+        self.cdf_mismatches = {}
+
+        # SkillBatch collecting the calls made inside 'with sch.batch():'
+        self.pending = None
+
+        # in sync mode only the differences to the existing contents are applied, see SchematicSync
+        self.sync_state = None
+        if sync:
+            with self.timings.phase('sync'):
+                self.sync_state = SchematicSync(self.ws, self.cv, prune_untagged)
 
     def load_schematic_contents(self):
         # print(self.ws.db)
@@ -50,6 +94,27 @@ class Schematic:
     
         self.ws.dd.delete_obj(self.ws.dd.get_obj(self.lib_name, self.cell_name, "schematic"))
 
+    def cell_timestamp(self, lib_name, cell_name, view='schematic'):
+        """
+        Modification time of a cellview on disk, None if it can not be found.
+        """
+        return cell_timestamp(self.ws, lib_name, cell_name, view, 'sch.oa')
+
+    def fingerprint(self):
+        """
+        Hash of the schematic contents recorded by this object (instances, parameters, wires, pins, notes)
+        and the modification times of this schematic and of every schematic in its hierarchy.
+        """
+        contents = self.__dict__()
+        contents['hierarchy'] = hierarchy_timestamps(self.ws, self.lib_name, self.cell_name)
+
+        def to_json(o):
+            if hasattr(o, 'tolist'):
+                return o.tolist()
+            return str(o)
+
+        return hashlib.sha256(json.dumps(contents, sort_keys=True, default=to_json).encode()).hexdigest()
+
     def __dict__(self):
         s = {}
 
@@ -74,91 +139,151 @@ class Schematic:
         return s
 
     @classmethod
-    def from_dict(cls, d, lib_name, cell_name, ws_name="default", overwrite=True, verbose=False):
+    def from_dict(cls, d, lib_name, cell_name, workspace="default", overwrite=True, verbose=False, filename=None):
         """
         Create a new schematic object from a dictionary representation.
-        """
-
-
-        new_schematic = cls(lib_name, cell_name, ws_name=ws_name, overwrite=overwrite, verbose=verbose)
-
-        for instances_params in d['instances_params']:
-            inst = _Inst(new_schematic.ws, new_schematic.cv, *instances_params)
-
-            new_schematic.instances[instances_params[3]] = inst
-
-            if instances_params[3] in d['instances']:
-                for ap, value in d['instances'][instances_params[3]].items():
-                    inst[ap] = value
-                
-            new_schematic.instances_params.append(instances_params)
-
-        for pin_params in d['pins']:
-            inputCVId = new_schematic.ws.db.open_cell_view("basic", pin_params[0], "symbol")
-            new_schematic.ws.sch.create_pin(new_schematic.cv, inputCVId, *pin_params[1:])
-            new_schematic.pins.append(pin_params)
-
-        for (wire_params, label_params) in d['wires']:
-            mode, arg2, pos, snap_spacing, snap_spacing, arg6 = wire_params
-            w = new_schematic.ws.sch.create_wire(new_schematic.cv, mode, arg2, pos, snap_spacing,
-                                                snap_spacing, arg6)
-            if label_params is not None:
-                new_schematic.ws.sch.create_wire_label(new_schematic.cv, w[0], *label_params)
-
-            new_schematic.wires.append((wire_params, label_params))
-
-        for note_params in d['notes']:
-            new_schematic.ws.sch.create_note_label(new_schematic.cv, *note_params)
-            new_schematic.notes.append(note_params)
-
-        new_schematic.param_vars = d['param_vars'].copy()
-        new_schematic.cdf_ignore = d['cdf_ignore'].copy()
+        The description is compiled into one SKILL script which Virtuoso runs in a single call,
+        the instances are looked up in Virtuoso when they are first used.
 
+        Parameters
+        ----------
+        workspace : Workspace or string
+            workspace or workspace id to create the schematic in, "default" opens '{$USER}_0'
+        filename : string
+            .il file to write the compiled description to, None sends it with the call
+            (or through a temporary file if it is too long for one call)
+        """
+        new_schematic = cls(open_workspace(workspace), lib_name, cell_name, overwrite=overwrite, verbose=verbose)
+        new_schematic.replay(d, filename)
         new_schematic.save()
 
-
         return new_schematic
 
     @classmethod
-    def from_sch(cls, sch, lib_name, cell_name, ws_name, overwrite=False, verbose=True):
+    def from_sch(cls, sch, lib_name, cell_name, workspace=None, overwrite=False, verbose=True, filename=None, mode='auto'):
         """
         Create a new schematic object from an existing schematic object.
-        """
-
-        new_schematic = cls(lib_name, cell_name, ws_name=ws_name, overwrite=overwrite, verbose=verbose)
 
-        for instances_params in sch.instances_params:
-            inst = _Inst(new_schematic.ws, new_schematic.cv, *instances_params)
-
-            new_schematic.instances[instances_params[3]] = inst
-            new_schematic.instances_params.append(instances_params)
-
-        for pin_params in sch.pins:
-            inputCVId = new_schematic.ws.db.open_cell_view("basic", pin_params[0], "symbol")
-            new_schematic.ws.sch.create_pin(new_schematic.cv, inputCVId, *pin_params[1:])
-            new_schematic.pins.append(pin_params)
-
-        for (wire_params, label_params) in sch.wires:
-            mode, arg2, pos, snap_spacing, snap_spacing, arg6 = wire_params
-            w = new_schematic.ws.sch.create_wire(new_schematic.cv, mode, arg2, pos, snap_spacing,
-                                                snap_spacing, arg6)
-            if label_params is not None:
-                new_schematic.ws.sch.create_wire_label(new_schematic.cv, w[0], *label_params)
-
-            new_schematic.wires.append((wire_params, label_params))
+        Parameters
+        ----------
+        workspace : Workspace or string
+            workspace or workspace id to create the schematic in, defaults to the workspace of sch
+        mode : string
+            'clone' copies the cellview inside Virtuoso in one call and only rebuilds the objects recorded by sch.
+            Parameters are copied as they are and CDF callbacks are not run again. An existing destination
+            cellview is only replaced when overwrite is set.
+            'replay' recreates the contents with from_dict.
+            'auto' clones when the new schematic is in the same Virtuoso session as sch and the destination
+            does not exist or overwrite is set, otherwise it replays.
+        """
+        if workspace is None:
+            workspace = sch.ws
+        ws = open_workspace(workspace)
+
+        same_session = ws is sch.ws or getattr(ws, 'id', None) == getattr(sch.ws, 'id', None)
+        exists = False
+        if mode in ['auto', 'clone'] and same_session and not overwrite:
+            exists = evaluate(ws, f'ddGetObj({skill(lib_name)} {skill(cell_name)} "schematic") != nil')
+
+        if mode == 'auto':
+            mode = 'clone' if same_session and not exists else 'replay'
+        elif mode == 'clone' and exists:
+            raise Exception(f"{lib_name}.{cell_name} already exists, set overwrite=True to replace it with a clone")
+
+        if mode == 'replay':
+            return cls.from_dict(sch.__dict__(), lib_name, cell_name, ws, overwrite, verbose, filename)
+        elif mode != 'clone':
+            raise Exception(f"Unknown from_sch mode '{mode}', expected one of ['auto', 'clone', 'replay']")
+
+        if verbose:
+            print(f"Copying {sch.lib_name}.{sch.cell_name} to {lib_name}.{cell_name}")
+
+        # the copy includes what was queued in a batch of sch so far
+        if sch.pending is not None:
+            sch.pending.send()
+
+        with sch.timings.phase('clone'):
+            copied = evaluate(ws, f'let((copy) unless(ddGetObj({skill(lib_name)}) dbCreateLib({skill(lib_name)})) '
+                                  f'copy = dbCopyCellView({skill(sch.cv)} {skill(lib_name)} {skill(cell_name)} "schematic" nil {skill(overwrite)}) '
+                                  f'when(copy dbClose(copy)) copy != nil)')
+        if not copied:
+            raise Exception(f"Could not copy {sch.lib_name}.{sch.cell_name} to {lib_name}.{cell_name}, "
+                            f"the destination may be open in another window or session")
+
+        # the copy is opened for editing like any existing schematic
+        new_schematic = cls(ws, lib_name, cell_name, overwrite=False, verbose=verbose)
+        new_schematic.record(sch.__dict__())
+        new_schematic.save(do_callbacks=False)
 
-        for note_params in sch.notes:
-            new_schematic.ws.sch.create_note_label(new_schematic.cv, *note_params)
-            new_schematic.notes.append(note_params)
+        return new_schematic
 
-        new_schematic.param_vars = sch.param_vars.copy()
-        new_schematic.cdf_ignore = sch.cdf_ignore.copy()
+    def replay(self, d, filename=None):
+        """
+        Create the instances, pins, wires and notes of a dictionary representation in this schematic
+        with one call to Virtuoso and record them as if they were created with create_instance etc.
+        """
+        with self.timings.phase('replay'):
+            load_schematic(self.ws, self.cv, d, filename)
+        self.record(d)
 
-        new_schematic.save()
+    def record(self, d):
+        """
+        Record the contents of a dictionary representation which already exist in the cellview
+        (eg. after replay or a cellview copy) without sending anything to Virtuoso.
+        """
+        for lib_name, cell_name, pos, name, rot in d['instances_params']:
+            inst = _LazyInst(self.ws, self.cv, lib_name, cell_name, pos, name, rot, d['instances'].get(name))
+            self.instances[name] = inst
+            self.instances_params.append((lib_name, cell_name, pos, name, rot))
+
+        self.pins += [tuple(p) for p in d['pins']]
+        self.wires += [(tuple(w), tuple(l) if l is not None else None) for w, l in d['wires']]
+        self.notes += [tuple(n) for n in d['notes']]
+        self.param_vars += d['param_vars']
+        self.cdf_ignore += d['cdf_ignore']
+
+    @contextmanager
+    def batch(self):
+        """
+        Queue the instances, wires, labels, pins and notes created inside the block and send them
+        to Virtuoso in one call when it exits (eg. with sch.batch(): ...).
+        Pin positions are available inside the block. Instance parameters set inside the block are
+        applied, and the created db objects are available, once the block exits.
+        """
+        if self.pending is not None:
+            yield self.pending
+            return
 
-        return new_schematic
+        batch = SkillBatch(self.ws)
+        self.pending = batch
+        try:
+            yield batch
+        finally:
+            self.pending = None
 
+        with self.timings.phase('batch'):
+            batch.send()
 
+    def evaluate(self, code):
+        """
+        Evaluate SKILL code, queued when inside sch.batch().
+        """
+        if self.pending is not None:
+            self.pending.call(self.ws['progn'], Var(code), keep=False)
+        else:
+            evaluate(self.ws, code)
+
+    # in sync mode an unchanged instance is reused, a changed one is deleted and created again
+    def new_inst(self, lib_name, cell_name, pos, name, rot, pin_positions=None):
+        if self.sync_state is not None:
+            kept, old = self.sync_state.instance(lib_name, cell_name, pos, name, rot)
+            if kept:
+                return _LazyInst(self.ws, self.cv, lib_name, cell_name, pos, name, rot, deferred=True)
+            if old is not None:
+                self.evaluate(f'dbDeleteObject({skill(old)})')
+        return _Inst(self.ws, self.cv, lib_name, cell_name, pos, name, rot, self.pending, pin_positions)
+
+    @timed('create_instance')
     def create_instance(self, lib_name, cell_name, pos, name, rot='R0'):
         """
         Instantiate a component in the schematic
@@ -181,12 +306,12 @@ class Schematic:
         inst_params = None
 
         if isinstance(pos, ConnPos):
-            inst = _Inst(self.ws, self.cv, lib_name, cell_name, pos.pos1, name, rot)
+            inst = self.new_inst(lib_name, cell_name, pos.pos1, name, rot)
             inst_params = (lib_name, cell_name, pos.pos1, name, rot)
             self.create_wire([pos.external_pin, inst.pins[pos.internal_pin]], net_name=pos.net_name, label_offset=pos.label_offset)
         elif isinstance(pos, list) or isinstance(pos, np.ndarray):
             if len(pos) == 2:
-                inst = _Inst(self.ws, self.cv, lib_name, cell_name, pos, name, rot)
+                inst = self.new_inst(lib_name, cell_name, pos, name, rot)
                 inst_params = (lib_name, cell_name, pos, name, rot)
         else:
             print('Pos parameter must be:')
@@ -200,6 +325,92 @@ class Schematic:
         self.instances_params.append(inst_params)
         return inst
 
+    @timed('create_instance_array')
+    def create_instance_array(self, lib_name, cell_name, rows, cols, pitch, name_fmt='I{r}_{c}', rot='R0', pos=[0., 0.],
+                              row_bus=None, col_bus=None, row_chain=None, col_chain=None):
+        """
+        Instantiate a rows x cols grid of a component and wire it up in one batch (eg. memory arrays, resistor ladders).
+        Returns an array handle, arr[r, c] is the instance in row r and column c.
+
+        Parameters
+        ----------
+        lib_name : string
+            library for the component (eg. 'analoglib')
+        cell_name : string
+            cell name for the component (eg. 'res')
+        rows, cols : int
+            size of the grid
+        pitch : [float, float] or float
+            distance between columns and between rows (eg. [4., -6.] places rows downwards)
+        name_fmt : string
+            instance name, formatted with the row r and column c (eg. 'XC_{r}_{c}')
+        rot : string
+            rotation of every instance (eg. 'R90')
+        pos : [float, float]
+            position of instance [0, 0]
+        row_bus : dict
+            pins wired along each row with a net name formatted with r, None for no label (eg. {'WL' : 'WL<{r}>'})
+        col_bus : dict
+            pins wired along each column with a net name formatted with c (eg. {'BL' : 'BL<{c}>'})
+        row_chain : list of (string, string)
+            connect the first pin of [r, c] to the second pin of [r, c + 1] (eg. [('MINUS', 'PLUS')])
+        col_chain : list of (string, string)
+            connect the first pin of [r, c] to the second pin of [r + 1, c]
+        """
+        pitch = np.broadcast_to(np.asarray(pitch, dtype=float), (2,))
+        r, c = np.mgrid[0:rows, 0:cols]
+        positions = np.asarray(pos, dtype=float) + np.stack([c * pitch[0], r * pitch[1]], axis=-1)
+
+        instances = np.empty((rows, cols), dtype=object)
+        with self.batch():
+            # every instance has the pins of instance [0, 0] moved by its offset
+            first = self.new_inst(lib_name, cell_name, positions[0, 0], name_fmt.format(r=0, c=0), rot)
+            offsets = first.pins.positions - positions[0, 0]
+            pin_positions = positions[:, :, None, :] + offsets
+
+            for ri, ci in np.ndindex(rows, cols):
+                name = name_fmt.format(r=ri, c=ci)
+                if ri == 0 and ci == 0:
+                    inst = first
+                else:
+                    inst = self.new_inst(lib_name, cell_name, positions[ri, ci], name, rot, pin_positions[ri, ci])
+                instances[ri, ci] = inst
+                self.instances[name] = inst
+                self.instances_params.append((lib_name, cell_name, positions[ri, ci], name, rot))
+
+            arr = _InstArray(instances, positions, first.pins.names, pin_positions)
+
+            # busses run through the pin of every instance in a row or column, labeled on the first segment
+            for pin_name, net_fmt in (row_bus or {}).items():
+                xy = arr.pin_xy(pin_name)
+                for ri in range(rows):
+                    net_name = net_fmt.format(r=ri) if net_fmt is not None else None
+                    for ci in range(cols - 1):
+                        self.create_wire([xy[ri, ci], xy[ri, ci + 1]], net_name=net_name if ci == 0 else None)
+
+            for pin_name, net_fmt in (col_bus or {}).items():
+                xy = arr.pin_xy(pin_name)
+                for ci in range(cols):
+                    net_name = net_fmt.format(c=ci) if net_fmt is not None else None
+                    for ri in range(rows - 1):
+                        self.create_wire([xy[ri, ci], xy[ri + 1, ci]], net_name=net_name if ri == 0 else None)
+
+            # chained pins that already abut need no wire
+            for pin_a, pin_b in (row_chain or []):
+                a, b = arr.pin_xy(pin_a)[:, :-1], arr.pin_xy(pin_b)[:, 1:]
+                apart = ~np.all(np.isclose(a, b), axis=-1)
+                for index in zip(*np.nonzero(apart)):
+                    self.create_wire([a[index], b[index]])
+
+            for pin_a, pin_b in (col_chain or []):
+                a, b = arr.pin_xy(pin_a)[:-1], arr.pin_xy(pin_b)[1:]
+                apart = ~np.all(np.isclose(a, b), axis=-1)
+                for index in zip(*np.nonzero(apart)):
+                    self.create_wire([a[index], b[index]])
+
+        return arr
+
+    @timed('create_wire')
     def create_wire(self, positions, net_name=None, label_offset=None, mode='route'):
 
         # transform into virtuoso coords
@@ -213,8 +424,21 @@ class Schematic:
             else:
                 pos.append(list(transform(positions[i])))
 
-        w = self.ws.sch.create_wire(self.cv, mode, "full", pos, snap_spacing,
-                                    snap_spacing, 0.0)
+        # in sync mode a wire created by an earlier run with the same arguments is kept
+        key = None
+        kept = False
+        if self.sync_state is not None:
+            key = sync_key(mode, pos, net_name, label_offset)
+            kept = self.sync_state.wire(key)
+
+        if kept:
+            w = None
+        elif self.pending is not None:
+            w = self.pending.call(self.ws.sch.create_wire, self.cv, mode, "full", pos, snap_spacing,
+                                  snap_spacing, 0.0)
+        else:
+            w = self.ws.sch.create_wire(self.cv, mode, "full", pos, snap_spacing,
+                                        snap_spacing, 0.0)
         
         # if net_name == 'Sum_b':
         #     print(f'Creating wire with net name: {net_name} at positions: {pos}')
@@ -226,37 +450,37 @@ class Schematic:
         #     print(self.ws.sch.create_wire)
         #     raise
 
-        points = []
-        if w is not None:
-            for wi in w:
-                points.append(wi.points)
-        
-        print(points)
+        if self.pending is None and not kept:
+            points = []
+            if w is not None:
+                for wi in w:
+                    points.append(wi.points)
+            
+            print(points)
 
         wire_params = (mode, "full", pos.copy(), snap_spacing, snap_spacing, 0.0)
         
         label_params = None
+        label = None
         if net_name != None:
             l_pos = pos[0]
             if label_offset != None:
                 label_offset = transform(label_offset)
                 l_pos = np.asarray(l_pos) + np.asarray(label_offset)
                 l_pos = list(l_pos)
-            self.ws.sch.create_wire_label(
-                self.cv,
-                w[0],
-                l_pos,
-                net_name,
-                "upperLeft",
-                "R0",
-                "fixed",
-                snap_spacing,
-                None,
-            )
+            if not kept:
+                label_args = (self.cv, w[0], l_pos, net_name, "upperLeft", "R0", "fixed", snap_spacing, None)
+                if self.pending is not None:
+                    label = self.pending.call(self.ws.sch.create_wire_label, *label_args, keep=key is not None)
+                else:
+                    label = self.ws.sch.create_wire_label(*label_args)
             label_params = (l_pos, net_name, "upperLeft", "R0", "fixed", snap_spacing, None)
             
 
         
+        if key is not None and not kept:
+            self.sync_state.created.append((key, w, label))
+
         self.wires.append((wire_params, label_params))
         # self.wires.append(w)      
         return w
@@ -264,12 +488,21 @@ class Schematic:
 
     def create_note(self, note, pos, size=0.125):
         pos = transform(pos)
-        self.ws.sch.create_note_label(self.cv, list(pos), note, "lowerLeft",
-                                      "R0", "fixed", size, "normalLabel")
-        
         note_params = (list(pos), note, "lowerLeft", "R0", "fixed", size, "normalLabel")
+
         self.notes.append(note_params)
 
+        # in sync mode an identical note is kept
+        if self.sync_state is not None and self.sync_state.note(note_params):
+            return
+
+        if self.pending is not None:
+            self.pending.call(self.ws.sch.create_note_label, self.cv, list(pos), note, "lowerLeft",
+                              "R0", "fixed", size, "normalLabel", keep=False)
+        else:
+            self.ws.sch.create_note_label(self.cv, list(pos), note, "lowerLeft",
+                                          "R0", "fixed", size, "normalLabel")
+
     def create_pin(self, name, direction, pos, rot='R0'):
         if isinstance(pos, ConnPos):
             pin_pos = pos.pos1
@@ -292,13 +525,22 @@ class Schematic:
                 print(f"Creation of Pin {name} Failed! \ndirection should be one of: [input, output, inputOutput]. got {direction}")
             return 0
 
-        inputCVId = self.ws.db.open_cell_view("basic", cell_name, "symbol")
-        p_id = self.ws.sch.create_pin(self.cv, inputCVId, name, direction,
-                                      None, list(pos), rot)
-        
         pin_params = (cell_name, name, direction, None, list(pos), rot)
         self.pins.append(pin_params)
 
+        if self.sync_state is not None:
+            p_id = self.sync_state.pin(pin_params)
+            if p_id is not None:
+                return p_id
+
+        inputCVId = default_symbol_cache().cellview(self.ws, "basic", cell_name)
+        if self.pending is not None:
+            p_id = self.pending.call(self.ws.sch.create_pin, self.cv, inputCVId, name, direction,
+                                     None, list(pos), rot)
+        else:
+            p_id = self.ws.sch.create_pin(self.cv, inputCVId, name, direction,
+                                          None, list(pos), rot)
+
         return p_id
 
     def add_param_vars(self, vars):
@@ -310,10 +552,25 @@ class Schematic:
     def redraw(self):
         self.ws.hi.redraw()
 
-    def do_cdf_callbacks(self):
+    def do_cdf_callbacks(self, names=None):
+        """
+        Run the CDF callbacks and check the applied parameters stuck.
 
-        # self.ws['CCSinvokeCdfCallbacks'](f"{self.cv} ?callInitProc t ?useInstCDF t")
-        self.ws['CCSinvokeCdfCallbacks'](self.cv, debug=True, callInitProc=True,useInstCDF=True)
+        Parameters
+        ----------
+        names : list of strings
+            instances to run the callbacks of, defaults to every instance in the schematic
+        """
+        instances = self.instances
+        if names is None:
+            # self.ws['CCSinvokeCdfCallbacks'](f"{self.cv} ?callInitProc t ?useInstCDF t")
+            self.ws['CCSinvokeCdfCallbacks'](self.cv, debug=True, callInitProc=True,useInstCDF=True)
+        else:
+            instances = {n: self.instances[n] for n in names if n in self.instances}
+            if len(instances) == 0:
+                return 0
+            evaluate(self.ws, f'foreach(name {skill(list(instances))} CCSinvokeInstCdfCallbacks('
+                              f'dbFindAnyInstByName({skill(self.cv)} name) ?debug t ?callInitProc t ?useInstCDF t))')
         # self.ws['CCSinvokeCdfCallbacks'](self.cv, addFormFields=True)
         # self.ws['CCSinvokeCdfCallbacks'](self.cv, debug=False, order=['wt', 'wf']) #'l', 'wt', 
         # self.ws['CCSinvokeCdfCallbacks'](self.cv, debug=True)
@@ -321,47 +578,72 @@ class Schematic:
         # CDF callbacks use the user applied parameters to calculate the actual parameters
         # Sometimes user applied parameters don't stick
         # let the user know if that happens:
+        self.cdf_mismatches = self.check_cdf_params(instances)
+
         rv = 0
-        for _, i in self.instances.items():
-            for a_p_name, a_p_value in i.applied_params.items():
-                if a_p_value == '' or a_p_value in self.param_vars or a_p_value in self.cdf_ignore or a_p_name == 'model':
-                    break
-                
-                calc_val = i.params[a_p_name].value
-                app_val = a_p_value
-
-                # convert strings to floats for comparison
-                if isinstance(app_val, str):
-                    app_val = convert_str_to_num(app_val)
-
-                if isinstance(calc_val, str):
-                    calc_val = convert_str_to_num(calc_val)
-
-                if isinstance(app_val, str):
-                    try:
-                        if calc_val != app_val:
-                            if self.verbose:
-                                print(f'Error: Calculated Parameter is not equal to Applied Parameter for {a_p_name} on {i.name}.')
-                                print(f'{i.params[a_p_name].value} != {a_p_value}')
-                                print(f'calc_val: {type(calc_val)}, app_val: {type(app_val)}')
-                            rv = 1
-                    
-                        elif not np.isclose(calc_val, app_val):
-                            if self.verbose:
-                                print(f'Error: Calculated Parameter is not close to Applied Parameter for {a_p_name} on {i.name}.')
-                                print(f'{i.params[a_p_name].value} != {a_p_value}')
-                            rv = 1
-                    except:
-                        if calc_val == app_val:
-                            continue
-                        else:
-                            print(f'Could not convert {calc_val} or {app_val} to float')
+        for name, mismatches in self.cdf_mismatches.items():
+            rv = 1
+            if self.verbose:
+                for p_name, app_val, calc_val in mismatches:
+                    print(f'Error: Calculated Parameter is not equal to Applied Parameter for {p_name} on {name}.')
+                    print(f'{calc_val} != {app_val}')
 
         return rv
 
+    def check_cdf_params(self, instances=None):
+        """
+        Compare the applied parameters of instances with their values in the database, read in one batched call.
+        Values that are numbers (eg. '400n' and 4e-07) are compared with np.isclose, others as strings.
+        Returns {instance name : [(parameter, applied value, database value), ...]} for the instances that differ.
+        """
+        if instances is None:
+            instances = self.instances
+
+        cache = default_cdf_cache()
+        checks = []
+        requests = []
+        for name, i in instances.items():
+            params = [p for p, v in i.applied_params.items()
+                      if not (v == '' or v in self.param_vars or v in self.cdf_ignore or p == 'model')]
+            if len(params) == 0:
+                continue
+            checks += [(name, p, i.applied_params[p]) for p in params]
+            requests.append((name, cache.cdf_names(self.ws, self.cv, name, i.lib_name, i.cell_name, params)))
+
+        if len(checks) == 0:
+            return {}
+
+        calc_vals = [v for values in read_values(self.ws, self.cv, requests) for v in values]
+        app_vals = [v for _, _, v in checks]
+
+        app_nums = convert_strs_to_nums(app_vals)
+        calc_nums = convert_strs_to_nums(calc_vals)
+        numeric = ~np.isnan(app_nums) & ~np.isnan(calc_nums)
+
+        same = np.array([str(a) == str(c) for a, c in zip(app_vals, calc_vals)])
+        same[numeric] = np.isclose(app_nums[numeric], calc_nums[numeric])
+
+        mismatches = {}
+        for k in np.nonzero(~same)[0]:
+            name, p_name, app_val = checks[k]
+            mismatches.setdefault(name, []).append((p_name, app_val, calc_vals[k]))
+        return mismatches
+
+    @timed('save')
     def save(self, do_callbacks=True):
+        # send what was queued so far when saving inside a batch
+        if self.pending is not None:
+            self.pending.send()
+
+        # in sync mode only the instances that changed need their callbacks
+        names = None
+        if self.sync_state is not None:
+            with self.timings.phase('sync'):
+                names = self.sync_state.finish(self.instances)
+            self.sync_state = None
+
         rv = 0
-        if do_callbacks and self.do_cdf_callbacks():
+        if do_callbacks and self.do_cdf_callbacks(names):
             rv = 1
 
         self.ws.sch.check(self.cv)
@@ -6,6 +6,17 @@ from matplotlib.lines import Line2D
 import matplotlib.colors as mcolors
 from .instance import _Pin
 from .utils import *
+from . import psf
+from .results import SweepResult
+from .cache import ResultCache
+from .sweep import SweepExecutor
+from .spectre import SpectreBatch
+from .monitor import SimulationMonitor
+from .decimate import decimate
+from .save_policy import SavePolicy
+from .threads import default_budget
+from .timing import Timings, timed, parse_spectre_times
+from .spectre_log import find_logs, parse_logs
 
 from skillbridge.client.hints import Symbol
 import numpy as np
@@ -21,16 +32,46 @@ class Simulator:
      -retieves data from Virtuoso in a readable format\n
      -plotting\n
     '''
-    def __init__(self, sch, model_files = None, view='schematic', show_netlist = False, verbose=True, output_dir=None):
+    def __init__(self, sch, model_files = None, view='schematic', show_netlist = False, verbose=True, output_dir=None, transfer='file', results='virtuoso', cache=None, netlist='auto', threads=None):
         self.sch = sch
+        self.view = view
         self.verbose = verbose
+
+        # wall time and skillbridge calls of each phase, shared with the Schematic
+        self.timings = sch.timings if hasattr(sch, 'timings') else Timings(sch.ws)
         self.temp = 27
 
+        # how waveform vectors are moved out of virtuoso:
+        # 'file' - guruWriteVector writes the vector to a file which is read with numpy
+        # 'list' - guruVectorToList returns the whole vector in one call
+        # 'elem' - one drGetElem call per sample (always available)
+        if transfer not in ['file', 'list', 'elem']:
+            raise Exception(f"Invalid transfer mode: {transfer}. Use one of: ['file', 'list', 'elem']")
+        self.transfer = transfer
+
+        # where extract_waves reads results from:
+        # 'virtuoso' - through the skillbridge session with getData
+        # 'psf' - directly from the psf files spectre writes to psf_dir
+        if results not in ['virtuoso', 'psf']:
+            raise Exception(f"Invalid results source: {results}. Use one of: ['virtuoso', 'psf']")
+        self.results = results
+
         if output_dir != None:
             self.output_dir = output_dir
         else:
             self.output_dir = os.getcwd()
 
+        self.psf_dir = self.output_dir + f'/sim_output/{self.sch.cell_name}/psf'
+        self.netlist_dir = self.output_dir + f'/sim_output/{self.sch.cell_name}/netlist'
+
+        # result cache: None to always simulate, True for the default cache directory,
+        # a directory name, or a ResultCache
+        if cache is True:
+            cache = ResultCache(verbose=verbose)
+        elif isinstance(cache, str):
+            cache = ResultCache(cache, verbose=verbose)
+        self.cache = cache
+
         # set simulator
         self.sch.ws['simulator'](Symbol('spectre'))
 
@@ -38,32 +79,39 @@ class Simulator:
             
         self.sch.ws['resultsDir'](self.output_dir + f'/sim_output/{self.sch.cell_name}')
 
-        if sch.ws['createNetlist'](recreate_all=True, display=show_netlist) == None:
-            if self.verbose:
-                print('ERROR netlist not created')
+        self.create_netlist(netlist, show_netlist)
 
         if model_files is not None:
             model_files = [os.path.abspath(m) for m in model_files]
             self.sch.ws['modelFile'](*model_files)
+        self.model_files = model_files if model_files is not None else []
+
+        self.duration = None
+        self.errpreset = None
+        self.stim_filename = None
+        self.stims = None
+
+        # what spectre writes to psf_dir, applied at run() (see set_save_policy)
+        self.save_policy = SavePolicy()
+
+        # SweepExecutor used when run() is given a list of workspaces
+        self.sweep_executor = None
 
 
         # analysis order in case of multiple analysis
         self.sch.ws['envOption'](Symbol('analysisOrder'), ['tran'])
 
         # performance options
-        self.sch.ws['option'](Symbol('nthreads'), '25',\
-                              Symbol('multithread'), 'on')
-
-        self.sch.ws['option']('?categ', Symbol('turboOpts'),\
-                            Symbol('numThreads'), '25',\
-                            Symbol('mtOption'), 'Manual',\
-                            Symbol('apsplus'), 't')
+        # threads - spectre threads, None to split the available cpus between the active Simulators
+        self.threads = threads
+        self.thread_budget = default_budget()
+        self.set_threads()
 
         # the time values for each simulation
         self.x = []
 
         # dictionary of waves keyed on netname containing another dictionary with wave data:
-        # 'y' - list of ydata, [0] is a list from the 1st simulation etc.
+        # 'y' - ydata, during parametric analysis a (sweep point, time) array where [0] is the 1st simulation etc.
         # 'type' - used by virtuoso to denote voltage ('v') or current ('i') for custom waves this is the y_axis label
         # 'group' - name of the group for checkboxes in plot
         # 'data type' - used to denote a custom wave
@@ -83,22 +131,139 @@ class Simulator:
         # paramter analysis sets
         self.param_sets = None
 
+        # design variable values set through guru (eg. by run_point), part of the cache key
+        # OCEAN writes them into input.scs, which is not hashed
+        self.des_vars = {}
+
+        # sweep values of each parametric result, outermost sweep first (set by guruFlattenFamily)
+        self.sweep_labels = None
+
+        # set by check_transfer when guruFlattenFamily is loaded in virtuoso
+        self.flatten = False
+
+        # SweepResult holding every extracted and custom wave as a (sweep point, time) array
+        self.result = None
+
+        # SpectreLogs of the sweep points of the last failed run
+        self.logs = None
+
+        # how parametric results of different lengths share a time base, 'pad' or 'interp' (see SweepResult.from_lists)
+        self.align = 'pad'
+
+    # netlists the design
+    # mode - 'auto' reuses the existing netlist if the schematic is unchanged since it was written and
+    #        otherwise only renetlists the changed cells, 'full' renetlists the whole hierarchy
+    @timed('netlist')
+    def create_netlist(self, mode='auto', show_netlist=False):
+        state_filename = self.netlist_dir + '/.guru_netlist_state'
+
+        if mode == 'auto':
+            fingerprint = self.sch.fingerprint()
+            if os.path.isfile(self.netlist_dir + '/netlist') and os.path.isfile(state_filename):
+                with open(state_filename, 'r') as f:
+                    if f.read().strip() == fingerprint:
+                        if self.verbose:
+                            print(f'{self.sch.lib_name}/{self.sch.cell_name} is unchanged, reusing the existing netlist')
+                        return True
+            recreate_all = False
+        elif mode == 'full':
+            fingerprint = None
+            recreate_all = True
+        else:
+            raise Exception(f"Invalid netlist mode: {mode}. Use one of: ['auto', 'full']")
+
+        if self.sch.ws['createNetlist'](recreate_all=recreate_all, display=show_netlist) == None:
+            if self.verbose:
+                print('ERROR netlist not created')
+            return False
+
+        # a full netlist is not recorded, the next 'auto' netlist fingerprints the design again
+        if fingerprint is None:
+            if os.path.isfile(state_filename):
+                os.remove(state_filename)
+        else:
+            with open(state_filename, 'w') as f:
+                f.write(fingerprint)
+        return True
+
     def tran(self, duration, errpreset=None):
         if isinstance(duration, str):
             duration = convert_str_to_num(duration)
 
         self.duration = duration
 
+        if errpreset is not None and errpreset not in ['liberal', 'conservative', 'moderate']:
+            raise Exception(f'Invalid errpreset: {errpreset}')
+
         self.errpreset = errpreset
 
-        if self.errpreset is None:
-            self.sch.ws['analysis'](Symbol('tran'), '?start', '0', '?stop', duration, '?errpreset', 'moderate')
-        elif self.errpreset == 'liberal' or self.errpreset == 'conservative' or self.errpreset == 'moderate':
-            self.sch.ws['analysis'](Symbol('tran'), '?start', '0', '?stop', duration, '?errpreset', self.errpreset)
+        self.set_tran_analysis()
+
+    def set_tran_analysis(self):
+        errpreset = self.errpreset if self.errpreset is not None else 'moderate'
+        args = ['?start', '0', '?stop', self.duration, '?errpreset', errpreset]
+        if self.save_policy.strobe_period is not None:
+            args += ['?strobeperiod', self.save_policy.strobe_period]
+
+        self.sch.ws['analysis'](Symbol('tran'), *args)
+
+    def set_save_policy(self, policy=None, **kwargs):
+        """
+        Set what spectre saves, applied at the next run().
+        The default only saves the tracked signals and every power signal, as tran() used to.
+
+        Parameters
+        ----------
+        policy : SavePolicy
+            policy to use, or None to create one from kwargs
+        kwargs :
+            SavePolicy arguments (eg. mode='depth', depth=2, patterns=['/I0/*'], pwr='total', strobe_period=1e-12)
+        """
+        if policy is None:
+            policy = SavePolicy(**kwargs)
+        self.save_policy = policy
+        return policy
+
+    # issues the save options, wildcard saves and output strobing of the save policy
+    def apply_save_policy(self):
+        p = self.save_policy
+        args = [Symbol('save'), p.save, Symbol('currents'), p.currents, Symbol('pwr'), p.pwr]
+        if p.mode == 'depth':
+            args += [Symbol('nestlvl'), str(p.depth)]
+        self.sch.ws['saveOption'](*args)
+
+        definitions = self.output_dir + f'/sim_output/{self.sch.cell_name}/save_policy.scs'
+        if p.write_definitions(definitions):
+            self.sch.ws['definitionFile'](definitions)
         else:
-            raise Exception(f'Invalid errpreset: {self.errpreset}')
-        
-        self.sch.ws['saveOption'](Symbol('pwr'), 'all')
+            # a policy without patterns must not leave the file of an earlier policy active
+            self.sch.ws['definitionFile'](None)
+
+        if self.duration is not None:
+            self.set_tran_analysis()
+
+    # sets the spectre thread options, called again at every run() as other Simulators start and stop
+    def set_threads(self, threads=None):
+        if threads is not None:
+            self.threads = threads
+
+        n = self.threads if self.threads is not None else self.thread_budget.threads()
+        if n == getattr(self, 'applied_threads', None):
+            return n
+
+        if self.verbose:
+            print(f'Using {n} spectre threads')
+
+        self.sch.ws['option'](Symbol('nthreads'), str(n),\
+                              Symbol('multithread'), 'on')
+
+        self.sch.ws['option']('?categ', Symbol('turboOpts'),\
+                            Symbol('numThreads'), str(n),\
+                            Symbol('mtOption'), 'Manual',\
+                            Symbol('apsplus'), 't')
+
+        self.applied_threads = n
+        return n
 
     def set_temp(self, temp):
         self.temp = temp
@@ -118,6 +283,7 @@ class Simulator:
 # spectre snipit using stimulus file:
     # stimulusFile( ?xlate nil
     #     "/<path to netlist>/_graphical_stimuli.scs")
+    @timed('apply_stims')
     def apply_stims(self, stims):
         stim_filename = self.output_dir + f'/sim_output/{self.sch.cell_name}/graphical_stimuli.scs'
 
@@ -155,6 +321,8 @@ class Simulator:
         # self.sch.ws['hlcheck']('0') #not sure what this does. works without
         
         self.sch.ws['stimulusFile'](stim_filename)
+        self.stim_filename = stim_filename
+        self.stims = {name: s.copy() for name, s in stims.items()}
 
     def save_pin(self, pin, signal_type):
         pinfname = pin
@@ -170,6 +338,7 @@ class Simulator:
 
         self.waves[pinfname] = {}
         self.waves[pinfname]['type'] = sig_type
+        self.waves[pinfname]['save'] = 'i'
 
         if group != None:
             self.waves[pinfname]['group'] = group
@@ -188,6 +357,7 @@ class Simulator:
         net_name = f'/{net}'
         self.waves[net_name] = {}
         self.waves[net_name]['type'] = sig_type
+        self.waves[net_name]['save'] = 'v'
 
 
         if group != None:
@@ -198,18 +368,30 @@ class Simulator:
             self.cust_data_types.append(sig_type)
 
     # enables the user to provide a custom function for calculating things such as resistance
-    # fn - a funciton which will recieve an array of np arrays of the requested pins
-    def track_custom(self, fn, name, y_label, signal_types, pins, group=None):
+    # fn - a funciton which will recieve an array of np arrays of the requested pins followed by the x data
+    # signal_types - 'v' or 'i' for each pin, or 'custom' if the pin is the name of another custom wave
+    # vectorized - if True fn is called once with (sweep point, time) arrays covering the whole sweep
+    #              instead of once per sweep point. fn must return an array with one row per sweep point,
+    #              (sweep point, time) for a wave or (sweep point,) for one value per point
+    #              with align='pad' rows shorter than the longest sweep point end in nan padding
+    #              (see result.lengths), use nan aware functions such as np.nanmax
+    #              without vectorized each call gets the valid samples of one sweep point only
+    def track_custom(self, fn, name, y_label, signal_types, pins, group=None, vectorized=False):
         # holds the full names of the pins needed in the function
         pin_fns = []
         # track the pins required for the custom funciton
         for signal_type, pin in zip(signal_types, pins):
-            
+            # other custom waves are calculated first, see custom_order()
+            if signal_type == 'custom':
+                pin_fns.append(pin)
+                continue
+
             pinfname = self.save_pin(pin, signal_type)
 
             if pinfname not in self.waves:
                 self.waves[pinfname] = {}
                 self.waves[pinfname]['type'] = signal_type
+                self.waves[pinfname]['save'] = signal_type
                 self.waves[pinfname]['no plot'] = True
             pin_fns.append(pinfname)
 
@@ -222,6 +404,7 @@ class Simulator:
         self.waves[name]['type'] = y_label
         self.waves[name]['data type'] = 'custom'
         self.waves[name]['fn'] = fn
+        self.waves[name]['vectorized'] = vectorized
 
         if y_label not in self.cust_data_types:
             self.cust_data_types.append(y_label)
@@ -231,25 +414,112 @@ class Simulator:
             if group not in self.groups:
                 self.groups.append(group)
 
+    # orders the custom waves so each is calculated after the custom waves it depends on
+    def custom_order(self):
+        order = []
+        state = {}
+
+        def visit(cw):
+            if state.get(cw) == 'done':
+                return
+            if state.get(cw) == 'visiting':
+                raise Exception(f"Custom wave '{cw}' depends on itself")
+
+            state[cw] = 'visiting'
+            for p in self.waves[cw]['pins']:
+                if p in self.custom_wave_names:
+                    visit(p)
+                elif p not in self.waves:
+                    raise Exception(f"Custom wave '{cw}' depends on '{p}' which is not tracked")
+            state[cw] = 'done'
+            order.append(cw)
+
+        for cw in self.custom_wave_names:
+            visit(cw)
+
+        return order
+
     # builds a list of waves needed for each custom function and calls them
+    @timed('calc_custom')
     def calc_custom(self):
-        for cw in self.custom_wave_names:
-            self.waves[cw]['y'] = []
-            for x_i in range(len(self.x)):
-                wave_y_data = []
-                for p in self.waves[cw]['pins']:
-                    
-                    wave_y_data.append(self.waves[p]['y'][x_i])
-            
-                wave_y_data.append(self.x[x_i])
-                y = self.waves[cw]['fn'](wave_y_data)
-                self.waves[cw]['y'].append(y)
+        for cw in self.custom_order():
+            if self.waves[cw]['vectorized']:
+                # one call with the (sweep point, time) arrays of every pin
+                wave_y_data = [self.result[p] for p in self.waves[cw]['pins']]
+                wave_y_data.append(self.result.x)
+                y = np.asarray(self.waves[cw]['fn'](wave_y_data))
+
+                if y.ndim == 0 or len(y) != len(self.result):
+                    raise Exception(f"Vectorized custom wave '{cw}' returned shape {y.shape}, expected one row per "
+                                    f"sweep point: ({len(self.result)}, time) or ({len(self.result)},)")
+            else:
+                y = []
+                for i in range(len(self.result)):
+                    # only the valid samples, rows of shorter sweep points are padded with nan
+                    n = self.result.lengths[i]
+                    wave_y_data = []
+                    for p in self.waves[cw]['pins']:
+                        wave_y_data.append(self.result[p][i][:n])
+
+                    wave_y_data.append(self.result.x[i][:n])
+                    y.append(np.asarray(self.waves[cw]['fn'](wave_y_data)))
+
+                # pad waves of different lengths back into one (sweep point, time) array
+                if all(y_i.ndim == 0 for y_i in y) or len(set(y_i.shape for y_i in y)) == 1:
+                    y = np.stack(y)
+                else:
+                    dtype = np.result_type(*[y_i.dtype for y_i in y], np.float64)
+                    padded = np.full((len(y), max(np.size(y_i) for y_i in y)), np.nan, dtype=dtype)
+                    for i, y_i in enumerate(y):
+                        padded[i, :np.size(y_i)] = np.ravel(y_i)
+                    y = padded
+
+            # one value per sweep point
+            if y.ndim == 1:
+                y = y[:, np.newaxis]
+
+            self.result[cw] = y
+            self.waves[cw]['y'] = self.result_view(cw)
+
+    # stores the extracted waves in self.result
+    # x - x values, a list with one array per sweep point during parametric analysis
+    # ys - dictionary of y values keyed on wave name, same layout as x
+    def store_results(self, x, ys):
+        if self.param_sets == None:
+            self.result = SweepResult(x, ys)
+            self.x = self.result.x[0]
+        else:
+            self.result = SweepResult.from_lists(x, ys, self.param_sets, self.align)
+
+            # fall back to the sweep labels returned by guruFlattenFamily, outermost sweep is the first parameter
+            if len(self.result.coords) == 0 and self.sweep_labels is not None and len(self.sweep_labels) == len(self.result):
+                for j, p in enumerate(self.param_sets):
+                    self.result.coords[p] = np.asarray([l[j] for l in self.sweep_labels])
+
+            self.x = self.result.x
+
+        for name in ys:
+            self.waves[name]['y'] = self.result_view(name)
+
+    # the rows of self.result for a wave, a single row without parametric analysis
+    def result_view(self, name):
+        if self.param_sets == None:
+            return self.result[name][0]
+        return self.result[name]
 
     # calls getData to extract the waves from spectre
-    def extract_waves(self):
+    # source - 'virtuoso' or 'psf', defaults to the results source given to the Simulator
+    @timed('extract_waves')
+    def extract_waves(self, source=None):
         if len(self.waves) == 0:
             return None
-        
+
+        if source is None:
+            source = self.results
+
+        if source == 'psf':
+            return self.extract_psf_waves()
+
         waveforms = []
         extracted_names = []
         bad_waves = []
@@ -288,44 +558,118 @@ class Simulator:
                 print('No valid waves to extract')
             return
 
+        self.check_transfer()
+
         # convert the virtuoso wave format into a list of numpy arrays for each parameter set
         # if there are no param sets, the length of the list is 1
         if self.param_sets == None:
             y, x = self.waveform_to_vector(waveforms)
         else:
             y, x = self.param_waveform_to_vector(waveforms)
-            
 
-        self.x = x
+        self.store_results(x, dict(zip(extracted_names, y)))
+
+        return self.waves
+
+    # reads the waves straight from the psf files in psf_dir, no Virtuoso session is needed
+    def extract_psf_waves(self):
+        self.run_ok = True
+
+        try:
+            results = psf.load_results(self.psf_dir, 'tran')
+        except psf.PSFError as e:
+            self.run_ok = False
+            if self.verbose:
+                print(f'Error: {e}')
+            return
+
+        bad_waves = []
+        ys = {}
+        for name in self.waves:
+            # skip custom calculated waves
+            if 'fn' in self.waves[name]:
+                continue
+
+            psf_name = psf.signal_name(name, self.waves[name].get('save', 'v'))
+            if psf_name not in results[0]:
+                self.run_ok = False
+                if self.verbose:
+                    print(f"Error: Unable to extract {name} ('{psf_name}') from {results[0].filename}. Does it exist? Check that it is saved or try track_net")
+                bad_waves.append(name)
+                continue
+
+            units = results[0].units.get(psf_name)
+            if units == 'V':
+                self.waves[name]['signal_type'] = 'V'
+            elif units == 'A':
+                self.waves[name]['signal_type'] = 'I'
+
+            if self.param_sets == None:
+                ys[name] = results[0][psf_name]
+            else:
+                ys[name] = [r[psf_name] for r in results]
+
+        for name in bad_waves:
+            self.waves.pop(name)
 
-        for name, y_i in zip(extracted_names, y):
-            self.waves[name]['y'] = y_i
+        if self.param_sets == None:
+            self.store_results(results[0].sweep_values, ys)
+        else:
+            self.store_results([r.sweep_values for r in results], ys)
 
         return self.waves
 
+    # checks once per Simulator that the guruWaveformUtils.il helpers are loaded in virtuoso
+    # falls back to reading one element at a time if they are not
+    def check_transfer(self):
+        if self.transfer == 'elem':
+            self.flatten = False
+            return
+
+        self.flatten = bool(self.sch.ws['isCallable'](Symbol('guruFlattenFamily')))
+
+        helper = 'guruWriteVector' if self.transfer == 'file' else 'guruVectorToList'
+        if not self.sch.ws['isCallable'](Symbol(helper)):
+            if self.verbose:
+                print(f"{helper} is not loaded in Virtuoso, reading waves one sample at a time. Load launch_scripts/guruWaveformUtils.il for faster extraction.")
+            self.transfer = 'elem'
+
+    # converts a drVector into a numpy array
+    def vector_to_array(self, vec):
+        if self.transfer == 'file':
+            vec_filename = self.output_dir + f'/sim_output/{self.sch.cell_name}/guru_vector.txt'
+            if self.sch.ws['guruWriteVector'](vec, vec_filename) is not None:
+                with open(vec_filename, 'r') as f:
+                    values = f.read().split()
+                os.remove(vec_filename)
+                return np.asarray(values, dtype=float)
+
+            if self.verbose:
+                print(f"Unable to write {vec_filename} from Virtuoso, reading waves one sample at a time.")
+            self.transfer = 'elem'
+
+        elif self.transfer == 'list':
+            return np.asarray(self.sch.ws['guruVectorToList'](vec), dtype=float)
+
+        values = []
+        for i in range(self.sch.ws.dr.vector_length(vec)):
+            values.append(self.sch.ws.dr.get_elem(vec, i))
+
+        return np.asarray(values)
+
     # used in extract_waves()
     def waveform_to_vector(self, waveforms):
         vectors = []
-        x_vec = []
-        
+
         # convert the y data in each wave to numpy array
         for wave in waveforms:
             y_wave = self.sch.ws.dr.get_waveform_y_vec(wave)
-
-            y_vec = []
-            # each timestep
-            for i in range(self.sch.ws.dr.vector_length(y_wave)):
-                y_vec.append(self.sch.ws.dr.get_elem(y_wave, i))
-
-            vectors.append(np.asarray(y_vec))
+            vectors.append(self.vector_to_array(y_wave))
 
         # x vector is same for all these y vector
         x_wave = self.sch.ws.dr.get_waveform_x_vec(waveforms[0])
-        
-        for i in range(self.sch.ws.dr.vector_length(x_wave)):
-            x_vec.append(self.sch.ws.dr.get_elem(x_wave, i))
-        
-        return vectors, np.asarray(x_vec)
+
+        return vectors, self.vector_to_array(x_wave)
 
 
     def unpack_nested_waveform(self, waveform):
@@ -361,22 +705,40 @@ class Simulator:
         return y_vecs, x_vecs
 
 
+    # flattens a parametric waveform family in one call with guruFlattenFamily
+    # returns the sweep labels, x arrays and y arrays of each leaf waveform
+    def flatten_family(self, waveform, with_x=True):
+        labels, x_vecs, y_vecs = self.sch.ws['guruFlattenFamily'](waveform, with_x)
+
+        if with_x:
+            x_vecs = [np.asarray(x, dtype=float) for x in x_vecs]
+        y_vecs = [np.asarray(y, dtype=float) for y in y_vecs]
+
+        return labels, x_vecs, y_vecs
+
     # used in extract waves during parametric analysis
     def param_waveform_to_vector(self, waveforms):
         waves_y_data = []
         x_data = []
 
+        if self.flatten:
+            # x vector is same for all y vectors, only transfer it with the first wave
+            for i, wave in enumerate(waveforms):
+                labels, x_vecs, y_vecs = self.flatten_family(wave, with_x=(i == 0))
+                if i == 0:
+                    self.sweep_labels = labels
+                    x_data = x_vecs
+                waves_y_data.append(y_vecs)
+
+            return waves_y_data, x_data
+
         # convert the y data in each wave to numpy array
         for wave in waveforms:
             y_vecs, _ = self.unpack_nested_waveform(wave)
 
             y_data = []
             for y_vec in y_vecs:
-                y_data.append([])
-                for i in range(self.sch.ws.dr.vector_length(y_vec)):
-                    y_data[-1].append(self.sch.ws.dr.get_elem(y_vec, i)) #type:ignore
-
-                y_data[-1] = np.asarray(y_data[-1])
+                y_data.append(self.vector_to_array(y_vec))
 
             waves_y_data.append(y_data)
 
@@ -384,11 +746,7 @@ class Simulator:
         _, x_vecs = self.unpack_nested_waveform(waveforms[0])
 
         for x_vec in x_vecs:
-            x_data.append([])
-            for i in range(self.sch.ws.dr.vector_length(x_vec)):
-                x_data[-1].append(self.sch.ws.dr.get_elem(x_vec, i)) #type:ignore
-
-            x_data[-1] = np.asarray(x_data[-1])
+            x_data.append(self.vector_to_array(x_vec))
         
         return waves_y_data, x_data
 
@@ -413,26 +771,144 @@ class Simulator:
             return self.sch.ws['paramAnalysis'](l, self.call_paramAnalysis(p_values), values=v, sweep_type=Symbol('paramset'))
 
     
+    # hash of everything which changes the simulation results, None if there is no netlist to hash
+    def cache_key(self, p_values=None):
+        if not os.path.isdir(self.netlist_dir):
+            return None
+
+        # input.scs is regenerated on every run, the netlist files hold the design
+        netlist_files = sorted(os.path.join(self.netlist_dir, f) for f in os.listdir(self.netlist_dir)
+                               if f.startswith('netlist') and os.path.isfile(os.path.join(self.netlist_dir, f)))
+        if len(netlist_files) == 0:
+            return None
+
+        files = netlist_files + self.model_files
+        if self.stim_filename is not None:
+            files.append(self.stim_filename)
+
+        settings = {
+            'temp' : self.temp,
+            'duration' : self.duration,
+            'errpreset' : self.errpreset,
+            'p_values' : p_values,
+            # swept parameters are covered by p_values, their desVar only holds the point run last
+            'des_vars' : sorted((name, str(value)) for name, value in self.des_vars.items()
+                                if p_values is None or name not in p_values),
+            'waves' : sorted((name, self.waves[name].get('save')) for name in self.waves if 'fn' not in self.waves[name]),
+            'save_policy' : self.save_policy.settings(),
+        }
+
+        return self.cache.key(files, settings)
+
+    # fills self.result and self.waves from a cached SweepResult
+    def load_cached(self, result):
+        self.result = result
+        self.run_ok = True
+
+        if self.param_sets == None:
+            self.x = self.result.x[0]
+        else:
+            self.x = self.result.x
+
+        for name in self.result.names:
+            if name in self.waves:
+                self.waves[name]['y'] = self.result_view(name)
+
+    # creates a Simulator for sch (usually opened in another workspace) with the same models, analysis,
+    # stimuli and saved signals as this one. Custom waves are left to this Simulator.
+    def replicate(self, sch, output_dir):
+        sim = Simulator(sch, self.model_files if len(self.model_files) > 0 else None, view=self.view, verbose=self.verbose,
+                        output_dir=output_dir, transfer=self.transfer, results=self.results, threads=self.threads)
+        self.copy_settings(sim)
+        return sim
+
+    # applies the analysis, temperature, stimuli and saved signals of this Simulator to a replica
+    def copy_settings(self, sim):
+        sim.td_stim_defaults = self.td_stim_defaults.copy()
+        sim.align = self.align
+        sim.save_policy = self.save_policy
+        for name, value in self.des_vars.items():
+            sim.set_des_var(name, value)
+        if self.duration is not None:
+            sim.tran(self.duration, self.errpreset)
+        sim.set_temp(self.temp)
+        if self.stims is not None:
+            sim.apply_stims({name: s.copy() for name, s in self.stims.items()})
+
+        for name, w in self.waves.items():
+            if 'fn' in w or name in sim.waves:
+                continue
+            sim.sch.ws['save'](Symbol(w.get('save', 'v')), name.lstrip('/') if w.get('save') == 'v' else name)
+            sim.waves[name] = {k: v for k, v in w.items() if k in ['type', 'save', 'group', 'no plot']}
+
+    # runs a single sweep point with the given design variable values (eg. {'w_read' : 1e-6})
+    def run_point(self, values):
+        for param, value in values.items():
+            self.set_des_var(param, value)
+        return self.run()
+
+    def set_des_var(self, name, value):
+        self.sch.ws['desVar'](name, value)
+        self.des_vars[name] = value
+
     # runs the simulation
-    def run(self, plot_in_v=False, p_values=None):
+    # p_values - parameter values for a parametric sweep, point i uses the i-th value of every parameter
+    # workspaces - list of workspace ids, the sweep points are split across these Virtuoso sessions
+    @timed('run')
+    def run(self, plot_in_v=False, p_values=None, workspaces=None):
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache_key(p_values)
+            cached = self.cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                if self.verbose:
+                    print(f'Using cached results {self.cache.path(cache_key)}')
+                self.param_sets = p_values
+                self.load_cached(cached)
+                self.calc_custom()
+                return 0
 
-        if p_values != None:
-            # store the parameter sets
-            self.param_sets = p_values
+        if p_values != None and workspaces != None:
+            if self.sweep_executor is None or self.sweep_executor.workspace_ids != list(workspaces):
+                self.sweep_executor = SweepExecutor(self, workspaces, self.verbose)
 
-            self.sch.ws['temp'](self.temp)
+            if self.sweep_executor.run(p_values) is None:
+                return None
 
-            # set the default value of each parameter
-            for param in self.param_sets:
-                self.sch.ws['desVar'](param, self.param_sets[param][0])
+            if cache_key is not None:
+                self.cache.put(cache_key, self.result)
 
-            # call the recusive paramAnalysis function
-            self.call_paramAnalysis(p_values.copy())
-            self.sch.ws['paramRun']()
-        else:
-            # set temp and run
-            self.sch.ws['temp'](self.temp)
-            self.sch.ws['run']()
+            self.calc_custom()
+            return 0
+
+        self.apply_save_policy()
+
+        # only counted while spectre runs, idle Simulators do not take a share of the cpus
+        with self.thread_budget.running(self):
+            self.set_threads()
+
+            if p_values != None:
+                # store the parameter sets
+                self.param_sets = p_values
+
+                self.sch.ws['temp'](self.temp)
+
+                # set the default value of each parameter
+                for param in self.param_sets:
+                    self.set_des_var(param, self.param_sets[param][0])
+
+                # call the recusive paramAnalysis function
+                self.call_paramAnalysis(p_values.copy())
+                with self.timings.phase('simulate'):
+                    self.sch.ws['paramRun']()
+            else:
+                # set temp and run
+                self.sch.ws['temp'](self.temp)
+                with self.timings.phase('simulate'):
+                    self.sch.ws['run']()
+
+        self.timings.spectre = self.spectre_times()
 
         try:  # skillbridge cannot parse stdobj@0xhexnumber type data. But I don't need any parsing of that data so keeping it in try to prevent error
             self.sch.ws['selectResult'](Symbol('tran'))
@@ -452,13 +928,7 @@ class Simulator:
 
 
         if self.run_ok == False:
-            print('Simulation Failed. see ' + f'"./sim_output/{self.sch.cell_name}/psf/spectre.out" for details.' )
-            print('From spectre.out :\n')
-            with open(f'./sim_output/{self.sch.cell_name}/psf/spectre.out', 'r') as f:
-                for l in f:
-                    if 'error' in l.lower() or 'warning' in l.lower():
-                        print('\t' + l)
-        
+            self.logs = self.report_failure()
             return None
 
         # check if the simulation ran as long as requested
@@ -467,13 +937,63 @@ class Simulator:
             if self.check_sim_dur(self.x[-1]) == 1:
                 return None
         else:
-            for x in self.x:
-                if self.check_sim_dur(x[-1]) == 1:
+            # rows may be padded with nan, check the last valid sample
+            for x, n in zip(self.x, self.result.lengths):
+                if self.check_sim_dur(x[n - 1]) == 1:
                     return None
 
+        # custom waves are not cached, their functions may change between runs
+        if cache_key is not None:
+            self.cache.put(cache_key, self.result)
+
+        self.calc_custom()
+        return 0
+
+    # runs the netlist directly with spectre on a process pool instead of through ADE/OCEAN
+    # spectre - spectre executable, defaults to $GURU_SPECTRE or 'spectre'
+    # max_workers - number of spectre processes running at once
+    @timed('run_batch')
+    def run_batch(self, p_values=None, spectre=None, max_workers=None):
+        if SpectreBatch(self, spectre, max_workers).run(p_values) is None:
+            return None
+
         self.calc_custom()
         return 0
 
+    # spectre's cpu and elapsed times of the last run, one dictionary per spectre.out (per sweep point if there are several)
+    def spectre_times(self):
+        return [parse_spectre_times(l) for l in find_logs(self.psf_dir)]
+
+    # parses spectre.out of every sweep point of the last run, see SpectreLog
+    def spectre_logs(self, max_records=1000):
+        return parse_logs(self.psf_dir, max_records)
+
+    # prints the errors and warnings of the failed sweep points, returns their SpectreLogs
+    def report_failure(self, logs=None):
+        if logs is None:
+            logs = self.spectre_logs()
+
+        if len(logs) == 0:
+            print(f'Simulation Failed. No spectre.out found in "{self.psf_dir}"')
+            return logs
+
+        for log in logs:
+            if log.status == 'ok':
+                continue
+            print(f'Simulation Failed ({log.status}). see "{log.filename}" for details.')
+            print('From spectre.out :\n')
+            for r in log.errors + log.warnings:
+                print('\t' + repr(r).replace('\n', '\n\t'))
+            if log.counts['warning'] > len(log.warnings):
+                print(f"\t... {log.counts['warning'] - len(log.warnings)} more warnings")
+            print()
+        return logs
+
+    # returns a SimulationMonitor for following a long run from asyncio
+    # eg. asyncio.run(sim.monitor().watch(p_values=p_values))
+    def monitor(self, interval=1.0, wave_interval=10.0):
+        return SimulationMonitor(self, interval, wave_interval)
+
     def check_sim_dur(self, sim_dur):
         if not np.isclose(self.duration, sim_dur):
             self.run_ok = False
@@ -482,7 +1002,24 @@ class Simulator:
             return 1
         return 0
 
-    def plot(self, interactive=False, save=None):
+    # x and y rows of waves (on the same axis) decimated together to about max_points samples per row
+    # xlim - visible range in seconds, only this range is decimated
+    # waves that are not time series (eg. one scalar per sweep point from track_custom) are left out
+    def decimated(self, names, max_points=None, method='minmax', xlim=None):
+        names = [name for name in names if self.result[name].shape == self.result.x.shape]
+        if max_points is None or len(names) == 0:
+            return {name: (self.result.x, self.result[name]) for name in names}
+
+        n = len(self.result)
+        xs = np.tile(self.result.x, (len(names), 1))
+        ys = np.concatenate([self.result[name] for name in names])
+        xd, yd = decimate(xs, ys, max_points, method, xlim)
+        return {name: (xd[i*n:(i+1)*n], yd[i*n:(i+1)*n]) for i, name in enumerate(names)}
+
+    # max_points - samples per line drawn, waves are decimated to this (and redecimated on zoom/pan), None to draw every sample
+    # decimation - 'minmax' or 'lttb' (see decimate.py)
+    @timed('plot')
+    def plot(self, interactive=False, save=None, max_points=4000, decimation='minmax'):
 
         self.ax_info = {}
         linestyles = ['solid', 'dashed', 'dashdot', 'dotted']
@@ -497,11 +1034,6 @@ class Simulator:
 
         ax = self.fig.axes
 
-        plot_x = self.x
-        if self.param_sets == None:
-            plot_x = [plot_x]
-        
-
         # y labels for voltage, current, and custom
         y_labels = self.cust_data_types
         ax_labels = y_labels
@@ -514,9 +1046,25 @@ class Simulator:
             legend_elements[l] = []
             self.ax_info[l] = {'count' : 0, 'scale_factor' : 1}
 
+        # waves drawn on each axis
+        ax_waves = {}
         for name in self.waves:
             if 'no plot' in self.waves[name]:
                 continue
+            ax_des = self.waves[name]['group'] if 'group' in self.waves[name] else self.waves[name]['type']
+            ax_waves.setdefault(ax_des, []).append(name)
+
+        plot_data = {}
+        for ax_des, names in ax_waves.items():
+            plot_data.update(self.decimated(names, max_points, decimation))
+
+        for name in self.waves:
+            if 'no plot' in self.waves[name]:
+                continue
+            if name not in plot_data:
+                if self.verbose:
+                    print(f"Not plotting '{name}', it is not a time series (shape {self.result[name].shape})")
+                continue
 
             if 'group' in self.waves[name]:
                 ax_des = self.waves[name]['group']
@@ -527,12 +1075,9 @@ class Simulator:
             self.ax_info[ax_des]['count'] += 1
             cur_ax = ax_dict[ax_des]
 
-            plot_y = self.waves[name]['y']
-            if self.param_sets == None:
-                plot_y = [plot_y]
             pls = []
-            for (i,x), y in zip(enumerate(plot_x), plot_y):
-                pls.append(cur_ax.plot(x * 1e9, y, label=name, linestyle=linestyles[i], color=colors[self.ax_info[ax_des]['count']-1])[0])
+            for i, (x, y) in enumerate(zip(*plot_data[name])):
+                pls.append(cur_ax.plot(x * 1e9, y, label=name, linestyle=linestyles[i % len(linestyles)], color=colors[self.ax_info[ax_des]['count']-1])[0])
                 if i == 0:
                     legend_elements[ax_des].append(Line2D([0], [0], color=colors[self.ax_info[ax_des]['count']-1], label=name))
 
@@ -544,20 +1089,22 @@ class Simulator:
             ncol = max((1,int(self.ax_info[l]['count']/ 5)))
             # ax_i.legend(tuple(lines[l]), tuple(labels[l]), loc=(1.01,0.0), shadow=True)
             if self.param_sets != None:
-                for i in range(len(list(self.param_sets.values())[0])):
-                    v = []
-                    p = '['
-                    for v_i in list(self.param_sets.values()):
-                        v.append(v_i[i])
-
-                    for p_i in self.param_sets.keys():
-                        p += p_i + ', '
-                        
-                    p = p[:-2] + ']'
-                    legend_elements[l].append(Line2D([0], [0], color='k', linestyle=linestyles[i], label=f'{p} = {v}'))
+                for i in range(len(self.result)):
+                    legend_elements[l].append(Line2D([0], [0], color='k', linestyle=linestyles[i % len(linestyles)], label=self.result.label(i)))
 
             ax_i.legend(handles=legend_elements[l], bbox_to_anchor=(1.01,0.0), loc='upper left', shadow=True)
             # ax_i.legend(loc=(1.01,0.0), ncol = ncol)
+
+        # redecimate the visible range after a zoom or pan
+        if max_points is not None:
+            def on_xlim_changed(ax_i, names):
+                xlim = np.asarray(ax_i.get_xlim()) / 1e9
+                for name, (x, y) in self.decimated(names, max_points, decimation, xlim).items():
+                    for pl, x_i, y_i in zip(self.waves[name]['pl'], x, y):
+                        pl.set_data(x_i * 1e9, y_i)
+
+            for ax_des, names in ax_waves.items():
+                ax_dict[ax_des].callbacks.connect('xlim_changed', lambda ax_i, names=names: on_xlim_changed(ax_i, names))
     
         ax[-1].set_xlabel('Time (ns)')
 
@@ -0,0 +1,185 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+import subprocess
+
+from . import psf
+from .timing import parse_spectre_times
+from .spectre_log import parse_log
+
+
+# runs in a worker process, returns the spectre exit code
+def _run_spectre(cmd, cwd, log_filename):
+    with open(log_filename, 'w') as log:
+        return subprocess.run(cmd, cwd=cwd, stdout=log, stderr=subprocess.STDOUT).returncode
+
+
+class SpectreBatch:
+    '''
+    Runs the netlist written by createNetlist directly with the spectre executable, skipping ADE/OCEAN.\n
+    Every sweep point gets its own directory (batch_dir/<point>) with an input.scs and psf results.
+    Points are run on a bounded process pool and the psf results are collected into the Simulator.\n
+     -spectre: spectre executable, defaults to $GURU_SPECTRE or 'spectre'\n
+     -max_workers: number of spectre processes running at once, defaults to the number of cpus\n
+     -args: extra command line arguments for spectre\n
+     -threads: threads per spectre process, defaults to the Simulator's share of the cpus split between the workers\n
+    '''
+    def __init__(self, sim, spectre=None, max_workers=None, args=None, threads=None):
+        self.sim = sim
+        self.spectre = spectre if spectre is not None else os.getenv('GURU_SPECTRE', 'spectre')
+        self.max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+        self.args = args if args is not None else []
+        self.threads = threads
+        self.batch_dir = sim.output_dir + f'/sim_output/{sim.sch.cell_name}/batch'
+
+    def netlist_files(self):
+        netlist = os.path.join(self.sim.netlist_dir, 'netlist')
+        if not os.path.isfile(netlist):
+            raise Exception(f'No netlist found at {netlist}. Create the Simulator before running a batch.')
+
+        files = []
+        for f in ['netlistHeader', 'netlist', 'netlistFooter']:
+            path = os.path.join(self.sim.netlist_dir, f)
+            if os.path.isfile(path):
+                files.append(path)
+        return files
+
+    # writes the top level spectre input for one sweep point
+    def write_input(self, point_dir, values):
+        os.makedirs(point_dir, exist_ok=True)
+        input_filename = os.path.join(point_dir, 'input.scs')
+
+        netlist_files = self.netlist_files()
+
+        with open(input_filename, 'w') as f:
+            f.write('// generated by guru\n')
+            if not netlist_files[0].endswith('netlistHeader'):
+                f.write('simulator lang=spectre\n')
+                f.write('global 0\n')
+
+            if len(values) > 0:
+                f.write('parameters ' + ' '.join(f'{p}={v}' for p, v in values.items()) + '\n')
+
+            for m in self.sim.model_files:
+                f.write(f'include "{m}"\n')
+
+            for n in netlist_files:
+                f.write(f'include "{n}"\n')
+
+            if self.sim.stim_filename is not None:
+                f.write(f'include "{self.sim.stim_filename}"\n')
+
+            errpreset = self.sim.errpreset if self.sim.errpreset is not None else 'moderate'
+            policy = self.sim.save_policy
+            tran = f'tran tran stop={self.sim.duration} errpreset={errpreset}'
+            if policy.strobe_period is not None:
+                tran += f' strobeperiod={policy.strobe_period}'
+            f.write(tran + '\n')
+
+            for l in policy.save_statements(self.sim.waves):
+                f.write(l + '\n')
+
+            f.write(f'guruOptions options temp={self.sim.temp} {policy.options()}\n')
+
+        return input_filename
+
+    def command(self, input_filename, point_dir, threads=1):
+        cmd = [self.spectre, input_filename, '+escchars', '-format', 'psfbin',
+               '-raw', os.path.join(point_dir, 'psf')]
+        if not any(a.startswith('+mt') for a in self.args):
+            cmd.append(f'+mt={threads}')
+        return cmd + self.args
+
+    def run(self, p_values=None):
+        """
+        Simulate every sweep point and store the results in the Simulator.
+        Returns None if any point failed.
+
+        Parameters
+        ----------
+        p_values : dictionary
+            values of each parameter, point i uses the i-th value of every parameter
+            (eg. {'w_read' : [1e-6, 2.5e-6], 'r1' : [300, 40000]}). None runs a single simulation.
+        """
+        if self.sim.duration is None:
+            raise Exception('Call tran() before running a batch')
+
+        if p_values is None:
+            points = [{}]
+        else:
+            n_points = len(list(p_values.values())[0])
+            points = [{p: v[i] for p, v in p_values.items()} for i in range(n_points)]
+
+        point_dirs = [os.path.join(self.batch_dir, str(i)) for i in range(len(points))]
+
+        workers = min(self.max_workers, len(points))
+
+        # counted as an active simulation only while the spectre processes run
+        with self.sim.thread_budget.running(self):
+            if self.threads is not None:
+                threads = self.threads
+            elif self.sim.threads is not None:
+                threads = max(1, self.sim.threads // workers)
+            else:
+                threads = self.sim.thread_budget.threads(workers)
+
+            jobs = []
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for point_dir, values in zip(point_dirs, points):
+                    input_filename = self.write_input(point_dir, values)
+                    cmd = self.command(input_filename, point_dir, threads)
+                    jobs.append(pool.submit(_run_spectre, cmd, point_dir, os.path.join(point_dir, 'spectre.out')))
+
+                return_codes = [j.result() for j in jobs]
+
+        self.sim.timings.spectre = [parse_spectre_times(os.path.join(d, 'spectre.out')) for d in point_dirs]
+
+        self.sim.param_sets = p_values
+        self.sim.run_ok = True
+
+        xs = []
+        ys = {name: [] for name, w in self.sim.waves.items() if 'fn' not in w}
+        failed_logs = []
+        for i, (point_dir, rc) in enumerate(zip(point_dirs, return_codes)):
+            if rc != 0:
+                self.sim.run_ok = False
+                log = parse_log(os.path.join(point_dir, 'spectre.out'))
+                failed_logs.append(log)
+                if self.sim.verbose:
+                    print(f"Spectre failed on sweep point {i} {points[i]} ({log.status}), see '{log.filename}'")
+                    for r in log.errors:
+                        print('\t' + repr(r).replace('\n', '\n\t'))
+                continue
+
+            try:
+                r = psf.load_results(os.path.join(point_dir, 'psf'), 'tran')[0]
+            except psf.PSFError as e:
+                self.sim.run_ok = False
+                if self.sim.verbose:
+                    print(f'Error: {e}')
+                continue
+
+            xs.append(r.sweep_values)
+            for name in ys:
+                psf_name = psf.signal_name(name, self.sim.waves[name].get('save', 'v'))
+                if psf_name not in r:
+                    self.sim.run_ok = False
+                    if self.sim.verbose:
+                        print(f"Error: Unable to extract {name} ('{psf_name}') from {r.filename}")
+                    continue
+                ys[name].append(r[psf_name])
+
+        if not self.sim.run_ok:
+            self.sim.logs = failed_logs
+            return None
+
+        if p_values is None:
+            self.sim.store_results(xs[0], {name: y[0] for name, y in ys.items()})
+            if self.sim.check_sim_dur(self.sim.x[-1]) == 1:
+                return None
+        else:
+            self.sim.store_results(xs, ys)
+            for x, n in zip(self.sim.x, self.sim.result.lengths):
+                if self.sim.check_sim_dur(x[n - 1]) == 1:
+                    return None
+
+        return self.sim.waves
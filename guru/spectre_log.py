@@ -0,0 +1,263 @@
+# Streaming parser for the spectre.out log spectre writes next to its results.
+# Lines are read one at a time so multi GB logs are never held in memory.
+import os
+
+import regex as re
+
+
+# SI prefixes spectre uses when printing times and sizes
+_si_prefixes = {'a': 1e-18, 'f': 1e-15, 'p': 1e-12, 'n': 1e-9, 'u': 1e-6, 'm': 1e-3,
+                '': 1., 'k': 1e3, 'K': 1e3, 'M': 1e6, 'G': 1e9}
+_memory_units = {'bytes': 1, 'kbytes': 1e3, 'kb': 1e3, 'mbytes': 1e6, 'mb': 1e6, 'gbytes': 1e9, 'gb': 1e9}
+
+# eg. 'tran: time = 1.25 ns    (12.5 %), step = 10.3 ps    (0.103 %)'
+_progress_re = re.compile(r'(\w+): time = ([-+\d.eE]+) ?([afpnumkMG]?)s\s+\(\s*([\d.]+) %\), step = ([-+\d.eE]+) ?([afpnumkMG]?)s')
+_pid_re = re.compile(r'\(process id: (\d+)\)')
+# eg. "Total time required for tran analysis `tran': CPU = 1.23 s (0h 0m 1s), elapsed = 1.3 s (0h 0m 1s)."
+_time_re = re.compile(r'^\s*(.+?):?\s+CPU = ([\d.eE+-]+) ?([mu]?)s.*?elapsed = ([\d.eE+-]+) ?([mu]?)s')
+# eg. 'Warning from spectre at time = 1.2 ns during transient analysis `tran'.'
+_origin_re = re.compile(r'^(Error|Warning|Notice) found by spectre|^(Error|Warning|Notice) from spectre')
+_at_time_re = re.compile(r'at time = ([-+\d.eE]+) ?([afpnumkMG]?)s')
+# eg. '    ERROR (SPECTRE-16192): No convergence achieved with the minimum time step specified.'
+_message_re = re.compile(r'^\s*(ERROR|WARNING|NOTICE|FATAL)\s*(?:\(([\w-]+)\))?\s*:?\s*(.*)')
+_steps_re = re.compile(r'Number of (accepted|rejected) tran steps\s*=\s*(\d+)')
+_memory_re = re.compile(r'(?:Peak resident memory used|Maximum memory used)\s*[=:]\s*([\d.eE+-]+)\s*(\w+)', re.IGNORECASE)
+_completes_re = re.compile(r'spectre completes with (\d+) errors?, (\d+) warnings?,? and (\d+) notices?')
+_terminated_re = re.compile(r'spectre terminated prematurely', re.IGNORECASE)
+_timestep_re = re.compile(r'time ?step (is )?too small|minimum time ?step', re.IGNORECASE)
+
+
+def parse_progress(line):
+    """
+    Parse a spectre progress line.
+    Returns a dictionary with the analysis, time, percent and step or None if line is not a progress line.
+    """
+    m = _progress_re.search(line)
+    if m is None:
+        return None
+
+    return {'analysis' : m.group(1),
+            'time' : float(m.group(2)) * _si_prefixes[m.group(3)],
+            'percent' : float(m.group(4)),
+            'step' : float(m.group(5)) * _si_prefixes[m.group(6)]}
+
+
+def parse_pid(line):
+    """
+    Process id of spectre from the line announcing the simulation, None for any other line.
+    """
+    m = _pid_re.search(line)
+    return int(m.group(1)) if m is not None else None
+
+
+class LogRecord:
+    '''
+    A diagnostic from spectre.out.\n
+     -kind: 'error', 'warning', 'notice' or 'fatal'\n
+     -id: spectre message id (eg. 'SPECTRE-16192') or None\n
+     -message: message text, continuation lines are joined with newlines\n
+     -line: line number in spectre.out\n
+     -time: simulation time the message was reported at or None\n
+    '''
+    def __init__(self, kind, id, message, line, time=None):
+        self.kind = kind
+        self.id = id
+        self.message = message
+        self.line = line
+        self.time = time
+
+    @property
+    def timestep_too_small(self):
+        return _timestep_re.search(self.message) is not None
+
+    def to_dict(self):
+        return {'kind': self.kind, 'id': self.id, 'message': self.message, 'line': self.line, 'time': self.time}
+
+    def __repr__(self):
+        at = f' at {self.time:g}s' if self.time is not None else ''
+        return f"{self.kind.upper()}{f' ({self.id})' if self.id else ''}{at}: {self.message}"
+
+
+class SpectreLog:
+    '''
+    Diagnostics and statistics of one spectre run, filled line by line with feed().\n
+     -errors, warnings, notices: LogRecords, at most max_records of each are kept (counts include all)\n
+     -timestep_too_small: the error and warning records about the time step collapsing\n
+     -accepted_steps, rejected_steps: transient step counts\n
+     -peak_memory: peak memory in bytes\n
+     -cpu_time, elapsed_time: total times in seconds\n
+     -times: every CPU / elapsed time line keyed on its label\n
+     -completed: spectre printed its completion line, terminated: spectre stopped on a fatal error\n
+    '''
+    def __init__(self, filename=None, max_records=1000):
+        self.filename = filename
+        self.max_records = max_records
+
+        self.errors = []
+        self.warnings = []
+        self.notices = []
+        self.timestep_too_small = []
+        self.counts = {'error': 0, 'warning': 0, 'notice': 0, 'fatal': 0}
+        self.accepted_steps = None
+        self.rejected_steps = None
+        self.peak_memory = None
+        self.cpu_time = None
+        self.elapsed_time = None
+        self.times = {}
+        self.sim_time = None
+        self.pid = None
+        self.completed = False
+        self.terminated = False
+
+        self.line_number = 0
+        self.origin_time = None
+        self.current = None
+
+    def add(self, record):
+        if record.kind == 'fatal':
+            self.counts['fatal'] += 1
+            target = self.errors
+        else:
+            self.counts[record.kind] += 1
+            target = {'error': self.errors, 'warning': self.warnings, 'notice': self.notices}[record.kind]
+
+        if len(target) < self.max_records:
+            target.append(record)
+        if record.kind != 'notice' and record.timestep_too_small and len(self.timestep_too_small) < self.max_records:
+            self.timestep_too_small.append(record)
+
+    def close_record(self):
+        if self.current is not None:
+            self.add(self.current)
+            self.current = None
+
+    def feed(self, line):
+        """
+        Parse one line of spectre.out.
+        """
+        self.line_number += 1
+        stripped = line.strip()
+
+        # continuation lines of a message are indented and end at a blank line
+        if self.current is not None:
+            if stripped == '' or _message_re.match(line) or _origin_re.match(stripped):
+                self.close_record()
+            else:
+                self.current.message += '\n' + stripped
+                return
+
+        if stripped == '':
+            return
+
+        m = _origin_re.match(stripped)
+        if m is not None:
+            t = _at_time_re.search(stripped)
+            self.origin_time = float(t.group(1)) * _si_prefixes[t.group(2)] if t is not None else None
+            return
+
+        m = _message_re.match(line)
+        if m is not None:
+            self.current = LogRecord(m.group(1).lower(), m.group(2), m.group(3).strip(), self.line_number, self.origin_time)
+            self.origin_time = None
+            return
+
+        p = parse_progress(line)
+        if p is not None:
+            self.sim_time = p['time']
+            return
+
+        if self.pid is None:
+            pid = parse_pid(line)
+            if pid is not None:
+                self.pid = pid
+                return
+
+        m = _steps_re.search(line)
+        if m is not None:
+            if m.group(1) == 'accepted':
+                self.accepted_steps = (self.accepted_steps or 0) + int(m.group(2))
+            else:
+                self.rejected_steps = (self.rejected_steps or 0) + int(m.group(2))
+            return
+
+        m = _memory_re.search(line)
+        if m is not None:
+            unit = m.group(2).lower()
+            memory = float(m.group(1)) * _memory_units.get(unit, 1)
+            self.peak_memory = memory if self.peak_memory is None else max(self.peak_memory, memory)
+            return
+
+        m = _time_re.match(line)
+        if m is not None:
+            label = m.group(1).rstrip(':').strip()
+            cpu = float(m.group(2)) * _si_prefixes[m.group(3)]
+            elapsed = float(m.group(4)) * _si_prefixes[m.group(5)]
+            self.times[label] = {'cpu': cpu, 'elapsed': elapsed}
+            # 'Time used' is the total of the run
+            if label.startswith('Time used') or self.cpu_time is None:
+                self.cpu_time = cpu
+                self.elapsed_time = elapsed
+            return
+
+        if _completes_re.search(line) is not None:
+            self.completed = True
+        elif _terminated_re.search(line) is not None:
+            self.terminated = True
+
+    def finish(self):
+        self.close_record()
+        return self
+
+    @property
+    def status(self):
+        """
+        Failure classification: 'ok', 'timestep' (time step too small), 'error', 'terminated' or 'incomplete'.
+        """
+        if len(self.timestep_too_small) > 0 and self.counts['error'] + self.counts['fatal'] > 0:
+            return 'timestep'
+        if self.counts['error'] + self.counts['fatal'] > 0:
+            return 'error'
+        if self.terminated:
+            return 'terminated'
+        if not self.completed:
+            return 'incomplete'
+        return 'ok'
+
+    def summary(self):
+        return {'filename': self.filename, 'status': self.status, 'counts': dict(self.counts),
+                'timestep_too_small': len(self.timestep_too_small),
+                'accepted_steps': self.accepted_steps, 'rejected_steps': self.rejected_steps,
+                'peak_memory': self.peak_memory, 'cpu_time': self.cpu_time, 'elapsed_time': self.elapsed_time,
+                'sim_time': self.sim_time}
+
+    def __repr__(self):
+        return f'SpectreLog({self.filename}, {self.summary()})'
+
+
+def parse_log(filename, max_records=1000):
+    """
+    Parse a spectre.out file line by line. Returns a SpectreLog.
+    """
+    log = SpectreLog(filename, max_records)
+    with open(filename, 'r', errors='replace') as f:
+        for l in f:
+            log.feed(l)
+    return log.finish()
+
+
+def find_logs(directory):
+    """
+    spectre.out files of a psf directory, followed by those of the numbered sweep point directories.
+    """
+    logs = [os.path.join(directory, 'spectre.out')]
+    if os.path.isdir(directory):
+        for d in sorted((d for d in os.listdir(directory) if d.isdigit()), key=int):
+            logs.append(os.path.join(directory, d, 'spectre.out'))
+    return [l for l in logs if os.path.isfile(l)]
+
+
+def parse_logs(directory, max_records=1000):
+    """
+    Parse the spectre.out of every sweep point in a psf directory. Returns a list of SpectreLog.
+    """
+    return [parse_log(l, max_records) for l in find_logs(directory)]
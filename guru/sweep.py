@@ -0,0 +1,111 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import os
+import queue
+
+from skillbridge import Workspace
+
+from .schematic import Schematic
+
+
+class SweepExecutor:
+    '''
+    Runs the points of a parametric sweep concurrently on several Virtuoso sessions.\n
+    Each workspace gets a replica of the Simulator (same models, stimuli, analysis and saved signals)
+    which runs one sweep point at a time with run_point(). The Simulator's own workspace runs its points
+    through the Simulator itself, so its results directory and design are left as they are.
+    The per point results are gathered back into the Simulator in the same shape a single session paramRun produces.
+    '''
+    def __init__(self, sim, workspace_ids, verbose=True):
+        self.sim = sim
+        self.workspace_ids = list(workspace_ids)
+        self.verbose = verbose
+        self.replicas = []
+
+    def open_replicas(self):
+        # replicas opened earlier get the current analysis, stimuli and saved signals of the Simulator
+        if len(self.replicas) > 0:
+            for r in self.replicas:
+                if r is not self.sim:
+                    self.sim.copy_settings(r)
+            return self.replicas
+
+        for ws_id in self.workspace_ids:
+            # a second Simulator on the same session would move its resultsDir
+            if ws_id == self.sim.sch.ws.id:
+                self.replicas.append(self.sim)
+                continue
+
+            # replicas only netlist, the design is opened read only
+            ws = Workspace.open(workspace_id=ws_id)
+            sch = Schematic(ws, self.sim.sch.lib_name, self.sim.sch.cell_name, verbose=self.verbose, read_only=True)
+
+            output_dir = os.path.join(self.sim.output_dir, 'sweep', str(ws_id))
+            os.makedirs(output_dir + f'/sim_output/{sch.cell_name}', exist_ok=True)
+            self.replicas.append(self.sim.replicate(sch, output_dir))
+
+        return self.replicas
+
+    def run(self, p_values):
+        """
+        Run every sweep point and store the results in the Simulator.
+        Returns None if any point failed.
+
+        Parameters
+        ----------
+        p_values : dictionary
+            values of each parameter, point i uses the i-th value of every parameter
+            (eg. {'w_read' : [1e-6, 2.5e-6], 'r1' : [300, 40000]})
+        """
+        n_points = len(list(p_values.values())[0])
+        points = [{p: v[i] for p, v in p_values.items()} for i in range(n_points)]
+
+        replicas = self.open_replicas()
+        # points run on the Simulator itself are single runs, not a paramRun
+        self.sim.param_sets = None
+
+        todo = queue.Queue()
+        for i in range(n_points):
+            todo.put(i)
+
+        results = [None] * n_points
+
+        # every session pulls the next point when it finishes one
+        def worker(replica):
+            while True:
+                try:
+                    i = todo.get_nowait()
+                except queue.Empty:
+                    return
+                if self.verbose:
+                    print(f'Running sweep point {i} {points[i]} on {replica.sch.ws.id}')
+                if replica.run_point(points[i]) is not None:
+                    # custom waves are calculated once the sweep is gathered
+                    results[i] = (replica.x, {name: replica.waves[name]['y'] for name in replica.result.names
+                                              if name not in self.sim.custom_wave_names})
+
+        # every replica is counted before any starts, so the first does not take all the cpus
+        with ExitStack() as stack, ThreadPoolExecutor(max_workers=len(replicas)) as pool:
+            for r in replicas:
+                stack.enter_context(self.sim.thread_budget.running(r))
+            for f in [pool.submit(worker, r) for r in replicas]:
+                f.result()
+
+        failed = [i for i, r in enumerate(results) if r is None]
+        self.sim.param_sets = p_values
+        if len(failed) > 0:
+            self.sim.run_ok = False
+            if self.verbose:
+                print(f'Sweep points {failed} failed: {[points[i] for i in failed]}')
+            return None
+
+        names = results[0][1].keys()
+        self.sim.run_ok = True
+        self.sim.store_results([r[0] for r in results], {name: [r[1][name] for r in results] for name in names})
+        return self.sim.waves
+
+    def close(self):
+        for r in self.replicas:
+            if r is not self.sim:
+                r.sch.ws.close()
+        self.replicas = []
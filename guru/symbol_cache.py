@@ -0,0 +1,185 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from .cdf_cache import evaluate, skill
+
+
+def cell_timestamp(ws, lib_name, cell_name, view='symbol', file_name='symbol.oa'):
+    """
+    Modification time of a cellview on disk, None if it can not be found.
+    """
+    obj = ws.dd.get_obj(lib_name, cell_name, view, file_name)
+    if obj is None:
+        return None
+
+    path = obj.read_path
+    if path is None or not os.path.isfile(path):
+        return None
+    return os.path.getmtime(path)
+
+
+# read paths of the schematics of a cell and every non-primitive cell below it, walked in one call
+# cellviews opened by the walk are closed again, ones that were already open are left open
+_hierarchy_code = '''let((seen todo paths lib cell obj cv opened)
+  seen = makeTable("seen" nil)
+  todo = list(list({lib} {cell}))
+  while(todo
+    lib = caar(todo) cell = cadar(todo) todo = cdr(todo)
+    unless(seen[strcat(lib "/" cell)]
+      seen[strcat(lib "/" cell)] = t
+      when(obj = ddGetObj(lib cell "schematic" "sch.oa")
+        paths = cons(list(strcat(lib "/" cell) obj~>readPath) paths)
+        cv = dbFindOpenCellView(ddGetObj(lib) cell "schematic")
+        opened = !cv
+        when(opened cv = dbOpenCellViewByType(lib cell "schematic" nil "r"))
+        when(cv
+          foreach(h cv~>instHeaders
+            unless(member(h~>libName '("analogLib" "basic"))
+              todo = cons(list(h~>libName h~>cellName) todo)))
+          when(opened dbClose(cv))))))
+  paths)'''
+
+
+def hierarchy_timestamps(ws, lib_name, cell_name):
+    """
+    Modification times of the schematic of a cell and of every schematic in its hierarchy
+    (eg. {'lib/cell' : mtime, 'lib/subcell' : mtime}), None for files that can not be found.
+    """
+    paths = evaluate(ws, _hierarchy_code.format(lib=skill(lib_name), cell=skill(cell_name))) or []
+
+    timestamps = {}
+    for name, path in paths:
+        if path is None or not os.path.isfile(path):
+            timestamps[name] = None
+        else:
+            timestamps[name] = os.path.getmtime(path)
+    return timestamps
+
+
+class SymbolCache:
+    '''
+    Caches the pin geometry and the opened cellview of symbols per (lib, cell).\n
+    Pin geometry is kept in memory and, when cache_dir is given, in one json file per symbol. Both are
+    reused while the symbol's modification time is unchanged, the in memory entries are rechecked at most
+    once every recheck seconds. Opened cellviews belong to a Virtuoso session and are only kept in memory.\n
+     -cache_dir: directory for the json files, None to only cache in memory\n
+     -recheck: seconds an in memory entry is used before the symbol's modification time is checked again\n
+    '''
+    def __init__(self, cache_dir=None, recheck=5.0):
+        self.cache_dir = cache_dir
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        self.recheck = recheck
+
+        # {(lib, cell) : (mtime, time checked, [{'name' : pin name, 'bBox' : pin bounding box}, ...])}
+        self.pin_lists = {}
+        # {(lib, cell) : (pin list, pin names, (n_pins, 2) array of pin centers)}
+        self.centers = {}
+        # {(workspace id, lib, cell) : cellview}
+        self.cellviews = {}
+
+    def path(self, lib_name, cell_name):
+        return os.path.join(self.cache_dir, lib_name, f'{cell_name}.json')
+
+    def load(self, lib_name, cell_name, mtime):
+        path = self.path(lib_name, cell_name)
+        if mtime is None or not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('mtime') != mtime:
+            return None
+        return entry['ports']
+
+    def store(self, lib_name, cell_name, mtime, ports):
+        path = self.path(lib_name, cell_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'mtime': mtime, 'ports': ports}, f)
+        os.replace(tmp_path, path)
+
+    def pins(self, ws, lib_name, cell_name):
+        """
+        Pin names and bounding boxes of a symbol (eg. [{'name' : 'D', 'bBox' : [[x0, y0], [x1, y1]]}, ...]).
+        """
+        key = (lib_name, cell_name)
+        entry = self.pin_lists.get(key)
+        if entry is not None and time.monotonic() - entry[1] < self.recheck:
+            return entry[2]
+
+        mtime = cell_timestamp(ws, lib_name, cell_name)
+        if entry is not None:
+            if mtime is not None and mtime == entry[0]:
+                self.pin_lists[key] = (mtime, time.monotonic(), entry[2])
+                return entry[2]
+            # the symbol was edited (or can not be found), drop everything derived from it
+            self.invalidate(lib_name, cell_name)
+
+        ports = None
+        if self.cache_dir is not None:
+            ports = self.load(lib_name, cell_name, mtime)
+
+        if ports is None:
+            pl = ws.sch.symbol_to_pin_list(lib_name, cell_name, "symbol")
+            ports = [{'name': x['name'], 'bBox': [list(c) for c in x['pins'][0]['fig']['bBox']]} for x in pl['ports']]
+            if self.cache_dir is not None and mtime is not None:
+                self.store(lib_name, cell_name, mtime, ports)
+
+        self.pin_lists[key] = (mtime, time.monotonic(), ports)
+        return ports
+
+    def pin_centers(self, ws, lib_name, cell_name):
+        """
+        Pin names and an (n_pins, 2) array of the pin bounding box centers of a symbol.
+        """
+        key = (lib_name, cell_name)
+        ports = self.pins(ws, lib_name, cell_name)
+        entry = self.centers.get(key)
+        if entry is None or entry[0] is not ports:
+            names = [x['name'] for x in ports]
+            bboxes = np.asarray([x['bBox'] for x in ports], dtype=float).reshape(-1, 2, 2)
+            entry = (ports, names, bboxes.mean(axis=1))
+            self.centers[key] = entry
+        return entry[1], entry[2]
+
+    def cellview(self, ws, lib_name, cell_name, view='symbol'):
+        """
+        The symbol cellview opened for reading in the session of ws.
+        """
+        key = (getattr(ws, 'id', id(ws)), lib_name, cell_name, view)
+        cv = self.cellviews.get(key)
+        if cv is None:
+            cv = ws.db.open_cell_view_by_type(lib_name, cell_name, view)
+            if cv is not None:
+                self.cellviews[key] = cv
+        return cv
+
+    def invalidate(self, lib_name=None, cell_name=None):
+        """
+        Forget the cached symbols of a library or cell, or everything if neither is given.
+        The json files are kept and rechecked against the symbol's modification time.
+        """
+        def match(lib, cell):
+            return (lib_name is None or lib == lib_name) and (cell_name is None or cell == cell_name)
+
+        self.pin_lists = {k: v for k, v in self.pin_lists.items() if not match(*k)}
+        self.centers = {k: v for k, v in self.centers.items() if not match(*k)}
+        self.cellviews = {k: v for k, v in self.cellviews.items() if not match(k[1], k[2])}
+
+
+# shared by every Schematic in this process, $GURU_SYMBOL_CACHE enables the on disk cache
+_cache = None
+
+
+def default_symbol_cache():
+    global _cache
+    if _cache is None:
+        _cache = SymbolCache(os.getenv('GURU_SYMBOL_CACHE'))
+    return _cache
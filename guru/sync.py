@@ -0,0 +1,195 @@
+import hashlib
+import json
+
+import numpy as np
+
+from .cdf_cache import default_cdf_cache, evaluate, read_values, skill
+from .utils import convert_strs_to_nums
+from .instance import inst_vpos
+from .batch import Deferred
+
+
+# instances, pin instances and shapes of a cellview with the attributes they are compared on
+_read_code = '''let((insts pins shapes)
+  foreach(i {cv}->instances
+    if(i->libName == "basic" && member(i->cellName '("ipin" "opin" "iopin")) && i->pin
+      pins = cons(list(i i->pin->term->name i->cellName i->pin->term->direction i->xy i->orient) pins)
+      insts = cons(list(i i->name i->libName i->cellName i->xy i->orient) insts)))
+  foreach(s {cv}->shapes
+    shapes = cons(list(s s->objType s->layerName s->guruKey s->xy s->theLabel) shapes))
+  list(insts pins shapes))'''
+
+
+def to_json(o):
+    if hasattr(o, 'tolist'):
+        return o.tolist()
+    return str(o)
+
+
+def sync_key(*params):
+    """
+    Short hash identifying a wire by the arguments it was created with.
+    """
+    return hashlib.sha1(json.dumps(params, default=to_json).encode()).hexdigest()[:16]
+
+
+def xy_key(xy):
+    return tuple(round(float(v), 4) for v in xy)
+
+
+class SchematicSync:
+    '''
+    Compares the objects a script creates with the contents already in a schematic so only the differences are sent.\n
+    Instances, pins and notes are matched on their name, master, position and orientation. Wires can be rerouted by
+    Virtuoso, so the wires and labels guru creates are tagged with a 'guruKey' property holding a hash of their arguments.
+    Instances, pins, notes and tagged wires the script does not create again are deleted by finish().
+    Untagged wires and wire labels (eg. drawn by hand or by a run outside sync mode) are kept unless prune_untagged is set.\n
+     -prune_untagged: also delete the untagged wires and wire labels\n
+     -changed: names of the instances which were created, replaced or had parameters changed\n
+    '''
+    def __init__(self, ws, cv, prune_untagged=False):
+        self.ws = ws
+        self.cv = cv
+        self.prune_untagged = prune_untagged
+
+        insts, pins, shapes = evaluate(ws, _read_code.format(cv=skill(cv)))
+
+        # {name : (db object, lib, cell, xy, orientation)}
+        self.instances = {i[1]: (i[0], i[2], i[3], xy_key(i[4]), i[5]) for i in insts}
+        # {(cell, name, direction, xy, orientation) : [db object, ...]}
+        self.pins = {}
+        for obj, name, cell_name, direction, xy, orient in pins:
+            self.pins.setdefault((cell_name, name, direction, xy_key(xy), orient), []).append(obj)
+        # {key : [db object, ...]} for tagged wires and labels, {(xy, text) : [db object, ...]} for notes
+        self.wires = {}
+        self.notes = {}
+        # untagged wires and labels, not created by guru in sync mode
+        self.untagged = []
+        for obj, obj_type, layer, key, xy, text in shapes:
+            if key is not None:
+                self.wires.setdefault(key, []).append(obj)
+            elif obj_type == 'label' and layer == 'text':
+                self.notes.setdefault((xy_key(xy), text), []).append(obj)
+            elif layer == 'wire':
+                self.untagged.append(obj)
+
+        self.kept_instances = set()
+        self.kept = set()
+        self.changed = set()
+        # (key, wire objects, label) created in this run, tagged in finish()
+        self.created = []
+
+    def instance(self, lib_name, cell_name, pos, name, rot):
+        """
+        Match a requested instance. Returns (kept, db object to delete before creating it or None).
+        """
+        if name not in self.instances:
+            self.changed.add(name)
+            return False, None
+
+        obj, lib, cell, xy, orient = self.instances.pop(name)
+        if (lib, cell, xy, orient) == (lib_name, cell_name, xy_key(inst_vpos(cell_name, pos)), rot):
+            self.kept_instances.add(name)
+            return True, None
+
+        self.changed.add(name)
+        return False, obj
+
+    def pin(self, pin_params):
+        """
+        Match a requested pin (create_pin's pin_params). Returns its db object if it already exists.
+        """
+        cell_name, name, direction, _, pos, rot = pin_params
+        key = (cell_name, name, direction, xy_key(pos), rot)
+        objs = self.pins.get(key)
+        if objs:
+            self.kept.add(('pin', key))
+            return objs[0]
+        return None
+
+    def note(self, note_params):
+        key = (xy_key(note_params[0]), note_params[1])
+        if key in self.notes:
+            self.kept.add(('note', key))
+            return True
+        return False
+
+    def wire(self, key):
+        if key in self.wires:
+            self.kept.add(('wire', key))
+            return True
+        return False
+
+    def deleted(self):
+        """
+        Db objects in the schematic which were not requested again.
+        """
+        objs = [v[0] for v in self.instances.values()]
+        objs += [o for k, v in self.pins.items() if ('pin', k) not in self.kept for o in v]
+        objs += [o for k, v in self.notes.items() if ('note', k) not in self.kept for o in v]
+        objs += [o for k, v in self.wires.items() if ('wire', k) not in self.kept for o in v]
+        if self.prune_untagged:
+            objs += self.untagged
+        return objs
+
+    def finish(self, instances):
+        """
+        Delete what was not requested again, write the changed parameters of kept instances
+        and tag the new wires. Returns the names of the instances that changed.
+
+        Parameters
+        ----------
+        instances : dict
+            {name : _Inst} of the schematic
+        """
+        code = []
+
+        deleted = self.deleted()
+        if len(deleted) > 0:
+            code.append(f'foreach(o {skill(deleted)} when(o->pin && length(o->pin->term->pins) == 1 '
+                        f'dbDeleteObject(o->pin->term)) dbDeleteObject(o))')
+
+        for key, w, label in self.created:
+            # objects created inside a batch
+            if isinstance(w, Deferred):
+                w = w.value
+            if isinstance(label, Deferred):
+                label = label.value
+            objs = list(w or []) + ([label] if label is not None else [])
+            if len(objs) > 0:
+                code.append(f'foreach(o {skill(objs)} dbCreateProp(o "guruKey" "string" {skill(key)}))')
+
+        if len(code) > 0:
+            evaluate(self.ws, f'progn({" ".join(code)} t)')
+
+        # compare the applied parameters of kept instances with their values in one call each way
+        kept = [instances[n] for n in sorted(self.kept_instances) if len(instances[n].applied_params) > 0]
+        if len(kept) > 0:
+            cache = default_cdf_cache()
+            cdf_names = [cache.cdf_names(self.ws, self.cv, i.name, i.lib_name, i.cell_name, list(i.applied_params))
+                         for i in kept]
+            current = read_values(self.ws, self.cv, [(i.name, names) for i, names in zip(kept, cdf_names)])
+
+            # numbers are compared by value (eg. '400n' and 4e-07), everything else as strings
+            applied = [v for i in kept for v in i.applied_params.values()]
+            values = [v for vs in current for v in vs]
+            app_nums = convert_strs_to_nums(applied)
+            cur_nums = convert_strs_to_nums(values)
+            numeric = ~np.isnan(app_nums) & ~np.isnan(cur_nums)
+            same = np.array([str(a) == str(v) for a, v in zip(applied, values)], dtype=bool)
+            same[numeric] = np.isclose(app_nums[numeric], cur_nums[numeric])
+
+            writes = []
+            k = 0
+            for i, names in zip(kept, cdf_names):
+                n = len(names)
+                changed = {c: v for c, v, s in zip(names, i.applied_params.values(), same[k:k + n]) if not s}
+                k += n
+                if len(changed) > 0:
+                    self.changed.add(i.name)
+                    sets = ' '.join(f'cdfFindParamByName(cdf {skill(p)})->value = {skill(v)}' for p, v in changed.items())
+                    writes.append(f'let((cdf) cdf = cdfGetInstCDF(dbFindAnyInstByName({skill(self.cv)} {skill(i.name)})) {sets})')
+            if len(writes) > 0:
+                evaluate(self.ws, f'progn({" ".join(writes)} t)')
+
+        return self.changed
@@ -0,0 +1,144 @@
+import math
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+def _cgroup_cpus():
+    # cpu limit from the cgroup quota (v2 cpu.max or v1 cfs quota), None if unlimited
+    try:
+        with open('/sys/fs/cgroup/cpu.max', 'r') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+        return None
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', 'r') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us', 'r') as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return max(1, math.ceil(quota / period))
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+def available_cpus():
+    """
+    Number of cpus this process may use, from the cpu affinity and the cgroup cpu quota.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = _cgroup_cpus()
+    if quota is not None:
+        cpus = min(cpus, quota)
+    return cpus
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ThreadBudget:
+    '''
+    Splits the available cpus between the Simulators active on this machine, across python processes.\n
+    Every running simulation registers a file named <pid>_<id> in a shared directory while spectre runs.
+    Files of processes which no longer exist are removed when counting. Registering the same object again
+    (eg. a sweep registering its replicas before they start) is counted once until every registration is released.\n
+     -cpus: cpus to split, defaults to available_cpus()\n
+     -registry_dir: shared directory, defaults to <tmp>/guru_threads_<uid>\n
+    '''
+    def __init__(self, cpus=None, registry_dir=None):
+        self.cpus = cpus if cpus is not None else available_cpus()
+
+        if registry_dir is None:
+            registry_dir = os.path.join(tempfile.gettempdir(), f'guru_threads_{os.getuid()}')
+        self.registry_dir = registry_dir
+        os.makedirs(self.registry_dir, exist_ok=True)
+
+        # {token : number of registrations} of this process
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def register(self, obj):
+        """
+        Register obj as an active simulation. Returns the token to pass to unregister.
+        """
+        token = f'{os.getpid()}_{id(obj)}'
+        with self.lock:
+            self.counts[token] = self.counts.get(token, 0) + 1
+            if self.counts[token] == 1:
+                open(os.path.join(self.registry_dir, token), 'w').close()
+        return token
+
+    def unregister(self, token):
+        with self.lock:
+            # tokens of other processes (eg. dead ones found by active()) are not counted here
+            count = self.counts.pop(token, 1) - 1
+            if count > 0:
+                self.counts[token] = count
+                return
+        try:
+            os.remove(os.path.join(self.registry_dir, token))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def running(self, obj):
+        """
+        Count obj as an active simulation inside the block (eg. with budget.running(sim): ...).
+        """
+        token = self.register(obj)
+        try:
+            yield token
+        finally:
+            self.unregister(token)
+
+    def active(self):
+        """
+        Number of registered simulations whose process is still running.
+        """
+        n = 0
+        for token in os.listdir(self.registry_dir):
+            try:
+                pid = int(token.split('_')[0])
+            except ValueError:
+                continue
+
+            if _pid_alive(pid):
+                n += 1
+            else:
+                self.unregister(token)
+        return n
+
+    def threads(self, workers=1):
+        """
+        Threads each spectre process should use when every active simulation runs workers processes at once.
+        """
+        return max(1, self.cpus // max(1, self.active() * workers))
+
+
+# shared by every Simulator in this process
+_budget = None
+
+
+def default_budget():
+    global _budget
+    if _budget is None:
+        _budget = ThreadBudget()
+    return _budget
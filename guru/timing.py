@@ -0,0 +1,103 @@
+from contextlib import contextmanager
+from functools import wraps
+import json
+import os
+import time
+
+from .spectre_log import parse_log
+
+
+def parse_spectre_times(filename):
+    """
+    Read the CPU and elapsed times spectre reports in spectre.out.
+    Returns a dictionary of {'cpu' : seconds, 'elapsed' : seconds} keyed on the line's label
+    (eg. "Total time required for tran analysis `tran'").
+    """
+    if not os.path.isfile(filename):
+        return {}
+    return parse_log(filename).times
+
+
+def count_rpcs(ws):
+    """
+    Count the skillbridge calls made through ws. The count is kept on the channel as guru_rpc_count.
+    """
+    channel = ws._channel
+    if hasattr(channel, 'guru_rpc_count'):
+        return channel
+
+    send = channel.send
+    channel.guru_rpc_count = 0
+
+    def counted_send(data):
+        channel.guru_rpc_count += 1
+        return send(data)
+
+    channel.send = counted_send
+    return channel
+
+
+class Timings:
+    '''
+    Wall time and number of skillbridge calls spent in each phase of a run.\n
+     -phases: dictionary of {'calls', 'wall', 'rpc'} keyed on phase name, nested phases are included in their parents\n
+     -spectre: spectre's own times from spectre.out, one dictionary per simulation (see parse_spectre_times)\n
+    '''
+    def __init__(self, ws=None):
+        self.channel = count_rpcs(ws) if ws is not None else None
+        self.phases = {}
+        self.spectre = []
+
+    def rpc_count(self):
+        return self.channel.guru_rpc_count if self.channel is not None else 0
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        start_rpc = self.rpc_count()
+        try:
+            yield
+        finally:
+            p = self.phases.setdefault(name, {'calls': 0, 'wall': 0., 'rpc': 0})
+            p['calls'] += 1
+            p['wall'] += time.perf_counter() - start
+            p['rpc'] += self.rpc_count() - start_rpc
+
+    def reset(self):
+        self.phases = {}
+        self.spectre = []
+
+    def report(self):
+        return {'phases': {name: p.copy() for name, p in self.phases.items()}, 'spectre': list(self.spectre)}
+
+    def to_json(self, filename=None):
+        """
+        Dump the report as json, to filename if given.
+        """
+        s = json.dumps(self.report(), indent=2)
+        if filename is not None:
+            with open(filename, 'w') as f:
+                f.write(s)
+        return s
+
+    def __repr__(self):
+        lines = [f"{'phase':<24}{'calls':>8}{'wall (s)':>12}{'rpc':>8}"]
+        for name, p in self.phases.items():
+            lines.append(f"{name:<24}{p['calls']:>8}{p['wall']:>12.3f}{p['rpc']:>8}")
+        for i, times in enumerate(self.spectre):
+            for label, t in times.items():
+                lines.append(f"spectre[{i}] {label}: cpu {t['cpu']:.3f}s, elapsed {t['elapsed']:.3f}s")
+        return '\n'.join(lines)
+
+
+def timed(name):
+    """
+    Decorator recording a method as a phase in self.timings.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            with self.timings.phase(name):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
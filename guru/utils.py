@@ -15,10 +15,20 @@ def i_transform(pos):
         t_pos.append(n / snap_spacing)
     return np.asarray(t_pos)
 
+# rotation matrices are built once per angle
+_rotations = {}
+
+def rotation_matrix(degrees=0):
+    R = _rotations.get(degrees)
+    if R is None:
+        angle = np.deg2rad(degrees)
+        R = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        _rotations[degrees] = R
+    return R
+
 # from https://stackoverflow.com/questions/34372480/rotate-point-about-another-point-in-degrees-python
 def rotate(p, origin: tuple[int,int] = (0, 0), degrees=0):
-    angle = np.deg2rad(degrees)
-    R = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    R = rotation_matrix(degrees)
     o = np.atleast_2d(origin)
     p = np.atleast_2d(p)
     return np.squeeze((R @ (p.T - o.T) + o.T).T)
@@ -121,6 +131,27 @@ def convert_str_to_num(string):
     
     return num
 
+# SI prefixes understood by convert_strs_to_nums
+si_prefixes = {'': 1., 'a': 1e-18, 'f': 1e-15, 'p': 1e-12, 'n': 1e-9, 'u': 1e-6, 'm': 1e-3,
+               'k': 1e3, 'K': 1e3, 'meg': 1e6, 'Meg': 1e6, 'MEG': 1e6, 'M': 1e6, 'G': 1e9, 'T': 1e12}
+# number, optional prefix ('meg' is tried before 'm') and an optional unit (eg. '1.5fF', '2meg', '10mA')
+_si_number = re.compile(r'^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*(meg|Meg|MEG|[afpnumkKMGT])?[A-Za-z]*\s*$')
+
+# convert many values like '400n', '0.4u' or 1e-6 to an array of floats, nan where a value is not a number
+# each distinct value is only parsed once
+def convert_strs_to_nums(values):
+    values = np.asarray(['' if v is None else str(v) for v in values], dtype=str)
+    if len(values) == 0:
+        return np.zeros(0)
+
+    unique, inverse = np.unique(values, return_inverse=True)
+    nums = np.full(len(unique), np.nan)
+    for i, u in enumerate(unique):
+        m = _si_number.match(u)
+        if m is not None:
+            nums[i] = float(m.group(1)) * si_prefixes[m.group(2) or '']
+    return nums[inverse]
+
 # ([pin of other instance, pin_name], direction)
 class ConnPos:
     def __init__(self, external_pin, internal_pin, direction, offset=10, net_name=None, add_pin=False):
@@ -64,6 +64,7 @@ def main(args):
             f.write(f'load({sb_path})\n')
             f.write(f'pyStartServer ?id "{unix_username}_{tid}" ?python "LD_LIBRARY_PATH= {python_path}"\n')
             f.write('load("~/cadence/guru/launch_scripts/CCSinvokeCdfCallbacks.il")\n')
+            f.write('load("~/cadence/guru/launch_scripts/guruWaveformUtils.il")\n')
 
         
         if n_virtuosos_hidden > 0: